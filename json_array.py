@@ -0,0 +1,55 @@
+# json_array.py
+# Locates the first top-level JSON array in LLM output
+# - Works on a whole response or incrementally on streamed chunks
+# - Skips prose and code fences before the first '['
+# - Ignores brackets inside string literals
+
+from __future__ import annotations
+
+from typing import Optional
+
+class ArrayScanner:
+    """Incremental scan for the end of the first top-level JSON array
+    
+    feed() takes the text in pieces (a whole response or streamed chunks) and
+    returns the index just past the closing ']' within the piece that closes the
+    array, or None while it is still open. Text before the first '[' is skipped
+    and brackets inside string literals are ignored.
+    """
+    
+    def __init__(self):
+        self.depth = 0
+        self.in_string = False
+        self.escaped = False
+    
+    def feed(self, piece: str) -> Optional[int]:
+        for i, ch in enumerate(piece):
+            if self.in_string:
+                if self.escaped:
+                    self.escaped = False
+                elif ch == '\\':
+                    self.escaped = True
+                elif ch == '"':
+                    self.in_string = False
+            elif ch == '"' and self.depth:
+                self.in_string = True
+            elif ch == '[':
+                self.depth += 1
+            elif ch == ']' and self.depth:
+                self.depth -= 1
+                if self.depth == 0:
+                    return i + 1
+        return None
+
+def extract_json_array(text: str) -> str:
+    """Return the first balanced top-level JSON array in `text` in one left-to-right scan
+    
+    Code fences and surrounding prose are skipped because scanning starts at the
+    first '['. If the array never closes, the remainder of the text is returned
+    and the decoder reports the error.
+    """
+    start = text.find('[')
+    if start < 0:
+        return text.strip()
+    end = ArrayScanner().feed(text[start:])
+    return text[start:] if end is None else text[start:start + end]
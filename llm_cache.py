@@ -0,0 +1,49 @@
+# llm_cache.py
+# Deterministic LLM response cache — SQLite-backed, exact match
+# - Keyed by sha256 of (model, prompt, temperature)
+# - Entries expire after a TTL (default 1h)
+# - Only meant for low-temperature calls, where the same prompt gives the same answer
+
+from __future__ import annotations
+
+import hashlib
+import json
+import sqlite3
+import time
+from pathlib import Path
+from typing import Optional
+
+DEFAULT_CACHE_PATH = Path(".cache/llm.sqlite3")
+DEFAULT_TTL_S = 3600
+MAX_CACHEABLE_TEMPERATURE = 0.1
+
+def cache_key(model: str, prompt: str, temperature: float) -> str:
+    payload = json.dumps({"model": model, "prompt": prompt, "temperature": temperature}, sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+class LLMCache:
+    """key -> response text store; expired rows read as misses and are purged on open"""
+
+    def __init__(self, path: Path = DEFAULT_CACHE_PATH, ttl_s: int = DEFAULT_TTL_S):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self.ttl_s = ttl_s
+        self._conn = sqlite3.connect(str(path), check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses (key TEXT PRIMARY KEY, response TEXT NOT NULL, ts REAL NOT NULL)"
+        )
+        self._conn.execute("DELETE FROM responses WHERE ts < ?", (time.time() - ttl_s,))
+        self._conn.commit()
+
+    def get(self, key: str) -> Optional[str]:
+        row = self._conn.execute(
+            "SELECT response FROM responses WHERE key = ? AND ts >= ?",
+            (key, time.time() - self.ttl_s),
+        ).fetchone()
+        return row[0] if row else None
+
+    def set(self, key: str, response: str) -> None:
+        self._conn.execute(
+            "INSERT OR REPLACE INTO responses (key, response, ts) VALUES (?, ?, ?)",
+            (key, response, time.time()),
+        )
+        self._conn.commit()
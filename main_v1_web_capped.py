@@ -21,19 +21,331 @@ Last Updated: 2025-01-27
 
 import json
 import os
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 import re
-from typing import List, Dict, Any, Optional, Callable
+import sqlite3
+import sys
+import threading
+import time
+from pathlib import Path
+from typing import List, Dict, Any, Iterator, Optional, Callable, Tuple
 from langchain_openai import ChatOpenAI
 from langchain_google_genai import ChatGoogleGenerativeAI
 from windows_use.agent.enhanced_service import EnhancedAgent
 from dotenv import load_dotenv
-from web_search import create_web_search_function
+from json_array import ArrayScanner
+
+try:  # optional faster JSON parser
+    from orjson import loads as _json_loads
+except ImportError:
+    _json_loads = json.loads
 
 load_dotenv()
 
+# Console banners; each banner block is emitted with a single write
+BAR80 = "=" * 80
+RULE80 = "-" * 80
+
 # Configuration constants
 MAX_PLANNING_SEARCHES = 2  # Hard cap on search calls per query
 ESTIMATED_COST_PER_SEARCH = 0.02  # OpenRouter web plugin: $4/1k results with 5 results = $0.02 max
+RESOLUTION_CACHE_PATH = Path(".cache/resolutions.sqlite3")
+RESOLUTION_CACHE_TTL_S = 1800  # Same 30 minute window as the web search cache
+_TOKEN_RE = re.compile(r"\w+")
+
+# Filler words that don't count toward a fuzzy ResolutionCache.match
+_MATCH_STOPWORDS = frozenset({
+    "a", "an", "the", "and", "or", "of", "to", "in", "on", "at", "for", "by", "with", "from",
+    "is", "are", "was", "be", "it", "this", "that", "what", "which", "where", "how", "i", "my", "me",
+})
+
+# Words that signal something worth a web lookup; queries with none of them skip ambiguity detection
+_AMBIG_TRIGGERS = frozenset({
+    "near", "nearby", "nearest", "local", "around", "close", "closest",
+    "cheap", "cheapest", "affordable", "budget", "best", "good", "decent", "top", "popular",
+    "current", "latest", "today", "hours", "price", "prices",
+    "store", "shop", "branch", "restaurant", "buy", "order", "cart",
+})
+
+# Static prompt text goes first and per-call data last, so the shared prefix is identical on
+# every request and provider-side prompt caching can reuse it
+_BATCH_EXTRACTION_PREFIX = """Extract relevant information from search results to clarify each ambiguous element.
+
+For each ambiguous element, provide a concise, factual clarification (1-2 sentences max).
+Return as JSON object with element names as keys and clarifications as values.
+
+Example format:
+{"near Bashford Manor": "Located at 2100 Bashford Manor Ln, Louisville, KY 40207", "cheap": "Budget-friendly options under $10"}
+
+"""
+_EXTRACTION_PREFIX = """Extract relevant information from search results to clarify the ambiguous element.
+
+Provide a concise, factual clarification (1-2 sentences max) that would help someone complete the task.
+
+"""
+_REWRITE_PREFIX = """Rewrite the query below by incorporating the clarifications while maintaining the original intent.
+
+Rules:
+1. Replace ambiguous elements with specific information
+2. Add helpful context that guides the agent
+3. Keep the same overall structure and intent
+4. Make it more actionable and specific
+5. Don't make it overly long - just more precise
+
+"""
+
+# Local-reasoning fallbacks used once the search cap is hit, by ambiguity type
+_SUBJ_RE = re.compile(r"(cheap|affordable|best|good)")
+_SUBJECTIVE_TEMPLATES = {
+    'cheap': "Look for items under $20 or in the 'budget' section",
+    'affordable': "Look for items under $20 or in the 'budget' section",
+    'best': "Look for highly rated items (4+ stars) or 'best seller' labels",
+    'good': "Look for highly rated items (4+ stars) or 'best seller' labels",
+}
+
+
+def _subjective_fallback(element: str) -> str:
+    match = _SUBJ_RE.search(element.lower())
+    return _SUBJECTIVE_TEMPLATES[match.group(1)] if match else f"Use your best judgment for '{element}'"
+
+
+_FALLBACKS: Dict[str, Callable[[str], str]] = {
+    'LOCATION': lambda element: f"Look for {element} - try searching for nearby locations or using 'find store' features",
+    'SUBJECTIVE': _subjective_fallback,
+    'PRODUCT': lambda element: f"Search for '{element}' and select the most relevant option",
+}
+
+
+def _default_fallback(element: str) -> str:
+    return f"Proceed with '{element}' as specified"
+
+# Fallback instruction-line parsing: numbered lines and the list markers stripped from them
+_NUM_PREFIX = re.compile(r'^\d+\.')
+_LEAD_JUNK = re.compile(r'^[\d\.\-"\s]+')
+
+# Facts that can be lifted straight out of search snippets without an LLM extraction call
+_ADDRESS_RE = re.compile(
+    r"\d{1,6}\s+[A-Z][\w .]+?(?:St|Street|Ave|Avenue|Blvd|Ln|Lane|Rd|Road|Dr|Drive|Pkwy|Hwy)\b[^,]*,\s*[A-Z][a-z]+(?:\s[A-Z][a-z]+)*,\s*[A-Z]{2}\s*\d{5}"
+)
+_HOURS_RE = re.compile(r"\d{1,2}(?::\d{2})?\s*(?:AM|PM|am|pm)\s*[-–]\s*\d{1,2}(?::\d{2})?\s*(?:AM|PM|am|pm)")
+_PHONE_RE = re.compile(r"\(?\b\d{3}\)?[-.\s]\d{3}[-.\s]\d{4}\b")
+# (label, wording that asks for the fact, pattern); the element or search hint picks the field
+_STRUCTURED_FIELDS = (
+    ("Phone", re.compile(r"\b(?:phone|call|contact|number)\b", re.I), _PHONE_RE),
+    ("Hours", re.compile(r"\b(?:hours|open|opens|close|closes|closing|opening)\b", re.I), _HOURS_RE),
+    ("Located at", re.compile(r"\b(?:address|located|location|locations|where|near|nearby|nearest|directions)\b", re.I), _ADDRESS_RE),
+)
+_STRUCTURED_TYPES = frozenset({'LOCATION', 'BUSINESS'})
+# Hint words that say nothing about which business a result is for
+_GENERIC_HINT_WORDS = frozenset({
+    "store", "stores", "shop", "hours", "near", "nearby", "nearest", "phone", "number",
+    "address", "location", "locations", "open", "opening", "closing", "today", "contact",
+})
+
+# Body of a ```/```json fenced block; an unterminated fence (e.g. a stream cut short) runs to the end
+_JSON_FENCE = re.compile(r"```(?:json)?\s*(.*?)(?:```|$)", re.S)
+
+
+def _strip_fence(content: str) -> str:
+    """Return the JSON text of a model response, without any markdown code fence"""
+    match = _JSON_FENCE.search(content)
+    return (match.group(1) if match else content).strip()
+
+
+def _truncate_results(results: Any, limit: int = 2000) -> str:
+    """Render search results for a prompt, stopping once `limit` characters are reached"""
+    if isinstance(results, str):
+        return results[:limit]
+    items = results.get('results') if isinstance(results, dict) else None
+    if not isinstance(items, list):
+        return json.dumps(results, ensure_ascii=False, default=str)[:limit]
+    pieces, size = [], 0
+    for item in items:
+        piece = json.dumps(item, ensure_ascii=False, default=str)
+        pieces.append(piece)
+        size += len(piece) + 1
+        if size >= limit:
+            break
+    return "\n".join(pieces)[:limit]
+
+
+OPENROUTER_MODELS_URL = "https://openrouter.ai/api/v1/models"
+
+
+def _openrouter_catalog() -> Optional[set]:
+    """Model IDs OpenRouter currently serves, or None if the catalog can't be fetched"""
+    import requests
+    
+    try:
+        response = requests.get(OPENROUTER_MODELS_URL, timeout=10)
+        response.raise_for_status()
+        return {model.get('id') for model in response.json().get('data', [])}
+    except Exception as e:
+        print(f"⚠️  Could not fetch OpenRouter model catalog: {e}")
+        return None
+
+def _is_model_unavailable(error: Exception) -> bool:
+    """True when the error says the model itself can't be used (unknown or unavailable id)
+    
+    Transient failures such as rate limits and timeouts return False, so they
+    don't push the translator onto a fallback model for the rest of the run.
+    """
+    status = getattr(error, "status_code", None)
+    return status == 404 or (status == 400 and "model" in str(error).lower())
+
+# OpenRouter chat clients shared by translator and analyzer, keyed by (model, temperature, max_tokens)
+_LLM_POOL: Dict[Tuple[str, float, int], ChatOpenAI] = {}
+
+
+def _get_openrouter_llm(model: str, temperature: float = 0.1, max_tokens: int = 800) -> ChatOpenAI:
+    """Return the pooled OpenRouter client for this configuration, creating it on first use"""
+    key = (model, temperature, max_tokens)
+    llm = _LLM_POOL.get(key)
+    if llm is None:
+        llm = _LLM_POOL[key] = ChatOpenAI(
+            model=model,
+            temperature=temperature,
+            max_tokens=max_tokens,
+            api_key=os.getenv("OPENROUTER_API_KEY"),
+            base_url="https://openrouter.ai/api/v1",
+            default_headers={
+                "HTTP-Referer": os.getenv("OPENROUTER_HTTP_REFERER", "https://github.com/windows-use"),
+                "X-Title": os.getenv("OPENROUTER_X_TITLE", "Windows-Use Web Capped")
+            }
+        )
+    return llm
+
+
+@lru_cache(maxsize=4)
+def _get_executor_llm(model: str = 'gemini-2.5-flash-lite', temperature: float = 0.0) -> ChatGoogleGenerativeAI:
+    """Shared Gemini client so every agent in the process reuses one connection and auth token"""
+    return ChatGoogleGenerativeAI(model=model, temperature=temperature)
+
+
+class ResolutionCache:
+    """Dict-like element -> clarification store persisted in SQLite
+    
+    Keys are matched case- and whitespace-insensitively, entries expire after
+    `ttl_s`, and iteration yields the most recently stored entries last. An
+    in-memory word index supports looking entries up by free text (`match`).
+    """
+    
+    def __init__(self, path: Path = RESOLUTION_CACHE_PATH, ttl_s: int = RESOLUTION_CACHE_TTL_S):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self.ttl_s = ttl_s
+        self._conn = sqlite3.connect(str(path), check_same_thread=False)
+        # Resolutions are stored from the lookup worker threads
+        self._write_lock = threading.Lock()
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS resolutions ("
+            "key TEXT PRIMARY KEY, element TEXT NOT NULL, resolution TEXT NOT NULL, ts REAL NOT NULL)"
+        )
+        # Running totals that outlive the per-task counters (never expire)
+        self._conn.execute("CREATE TABLE IF NOT EXISTS counters (name TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+        self._conn.execute("DELETE FROM resolutions WHERE ts < ?", (time.time() - ttl_s,))
+        self._conn.commit()
+        
+        # word -> keys of the entries whose element contains it
+        self._token_index: Dict[str, set] = defaultdict(set)
+        for (key,) in self._conn.execute("SELECT key FROM resolutions"):
+            self._index(key)
+    
+    def _index(self, key: str) -> None:
+        for token in _TOKEN_RE.findall(key):
+            self._token_index[token].add(key)
+    
+    @staticmethod
+    def _key(element: str) -> str:
+        return " ".join(element.lower().split())
+    
+    def get(self, element: str, default: Optional[str] = None) -> Optional[str]:
+        row = self._conn.execute(
+            "SELECT resolution FROM resolutions WHERE key = ? AND ts >= ?",
+            (self._key(element), time.time() - self.ttl_s),
+        ).fetchone()
+        return row[0] if row else default
+    
+    def __getitem__(self, element: str) -> str:
+        value = self.get(element)
+        if value is None:
+            raise KeyError(element)
+        return value
+    
+    def __setitem__(self, element: str, resolution: str) -> None:
+        with self._write_lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO resolutions (key, element, resolution, ts) VALUES (?, ?, ?, ?)",
+                (self._key(element), element, str(resolution), time.time()),
+            )
+            self._conn.commit()
+            self._index(self._key(element))
+    
+    def match(self, text: str) -> Optional[Tuple[str, str]]:
+        """Return (element, resolution) for the live entry sharing the most words with `text`
+        
+        Stopwords are ignored, and an entry needs at least two shared words (or all
+        of its words, if it has fewer) so a single common word can't pull in an
+        unrelated resolution.
+        """
+        tokens = set(_TOKEN_RE.findall(text.lower())) - _MATCH_STOPWORDS
+        hits = Counter(key for token in tokens for key in self._token_index.get(token, ()))
+        for key, shared in hits.most_common():
+            if shared < min(2, len(set(_TOKEN_RE.findall(key)) - _MATCH_STOPWORDS)):
+                continue
+            row = self._conn.execute(
+                "SELECT element, resolution FROM resolutions WHERE key = ? AND ts >= ?",
+                (key, time.time() - self.ttl_s),
+            ).fetchone()
+            if row:
+                return row
+        return None
+    
+    def related(self, text: str) -> Dict[str, str]:
+        """Return element -> resolution for the live entries whose words all appear in `text`"""
+        tokens = set(_TOKEN_RE.findall(text.lower()))
+        keys = [
+            key for key in {key for token in tokens for key in self._token_index.get(token, ())}
+            if tokens.issuperset(_TOKEN_RE.findall(key))
+        ]
+        if not keys:
+            return {}
+        rows = self._conn.execute(
+            f"SELECT element, resolution FROM resolutions WHERE ts >= ? AND key IN ({','.join('?' * len(keys))}) ORDER BY ts",
+            (time.time() - self.ttl_s, *keys),
+        ).fetchall()
+        return dict(rows)
+    
+    def __contains__(self, element: object) -> bool:
+        return isinstance(element, str) and self.get(element) is not None
+    
+    def items(self) -> List[Tuple[str, str]]:
+        return self._conn.execute(
+            "SELECT element, resolution FROM resolutions WHERE ts >= ? ORDER BY ts",
+            (time.time() - self.ttl_s,),
+        ).fetchall()
+    
+    def __iter__(self) -> Iterator[str]:
+        return (element for element, _ in self.items())
+    
+    def __len__(self) -> int:
+        return self._conn.execute(
+            "SELECT COUNT(*) FROM resolutions WHERE ts >= ?", (time.time() - self.ttl_s,)
+        ).fetchone()[0]
+    
+    def add_to_counter(self, name: str, amount: int) -> int:
+        """Add `amount` to a persistent counter and return its new total"""
+        if amount:
+            self._conn.execute(
+                "INSERT INTO counters (name, value) VALUES (?, ?) "
+                "ON CONFLICT(name) DO UPDATE SET value = value + excluded.value",
+                (name, amount),
+            )
+            self._conn.commit()
+        row = self._conn.execute("SELECT value FROM counters WHERE name = ?", (name,)).fetchone()
+        return row[0] if row else 0
+
 
 class WebCappedTranslator:
     """Web-capped translation layer that resolves query ambiguities with strict cost controls"""
@@ -44,15 +356,28 @@ class WebCappedTranslator:
             model_name = "openai/gpt-4o-mini-search-preview:online"
         
         self.model_name = model_name
+        # Untried fallback models; the first real completion confirms the chosen one works
+        self._model_candidates: List[str] = []
+        self._llm_confirmed = llm is not None
+        # Concurrent resolutions share the fallback; only one of them may advance it
+        self._fallback_lock = threading.Lock()
         self.llm = llm if llm is not None else self._initialize_llm(model_name)
         self.max_searches = max_searches
         self.search_calls = 0
+        # Part of search_calls already added to the persistent lifetime total
+        self._search_calls_recorded = 0
         
         # Disable mid-task search capability
         self.allow_runtime_search = False
         
-        # Cache for resolved information to avoid duplicate searches
-        self._resolution_cache: Dict[str, str] = {}
+        # Cache for resolved information to avoid duplicate searches (persists across runs)
+        self._resolution_cache = ResolutionCache()
+        
+        # Clarifications per resolved ambiguity set, keyed by sorted (type, element) pairs
+        self._plan_cache: Dict[Tuple[Tuple[str, str], ...], Dict[str, str]] = {}
+        
+        # Guidance steps produced by the fused planning call when no search was needed
+        self.last_instructions: Optional[List[str]] = None
     
     def _initialize_llm(self, preferred_model: str):
         """Initialize LLM with GPT-4 Mini Search Preview as primary model"""
@@ -72,43 +397,60 @@ class WebCappedTranslator:
                 unique_models.append(model)
                 seen.add(model)
         
-        for model in unique_models:
+        # One catalog request instead of a test completion per candidate; variant suffixes
+        # such as ':online' are routing options on top of the base model ID
+        catalog = _openrouter_catalog()
+        if catalog is not None:
+            listed = [m for m in unique_models if m in catalog or m.split(':')[0] in catalog]
+            unique_models = listed + [m for m in unique_models if m not in listed]
+        
+        # The first real call validates the model; _invoke moves on if it turns out to be unavailable
+        self.model_name = unique_models[0]
+        self._model_candidates = unique_models[1:]
+        print(f"🤖 Using model: {self.model_name} (unverified until the first call)")
+        return _get_openrouter_llm(self.model_name)
+    
+    def _invoke(self, prompt: str):
+        """Invoke the LLM, moving on to the next candidate model if the first real call finds it unavailable"""
+        while True:
+            llm = self.llm
             try:
-                print(f"🤖 Trying model: {model}")
-                llm = ChatOpenAI(
-                    model=model,
-                    temperature=0.1,
-                    max_tokens=800,
-                    api_key=os.getenv("OPENROUTER_API_KEY"),
-                    base_url="https://openrouter.ai/api/v1",
-                    default_headers={
-                        "HTTP-Referer": os.getenv("OPENROUTER_HTTP_REFERER", "https://github.com/windows-use"),
-                        "X-Title": os.getenv("OPENROUTER_X_TITLE", "Windows-Use Web Capped")
-                    }
-                )
-                
-                # Test the model with a simple query
-                test_response = llm.invoke("Test")
-                print(f"✅ Successfully initialized: {model}")
-                self.model_name = model
-                return llm
-                
+                response = llm.invoke(prompt)
+                self._llm_confirmed = True
+                return response
             except Exception as e:
-                print(f"⚠️  Failed to initialize {model}: {str(e)}")
-                continue
-        
-        # If all models fail, raise an error
-        raise Exception("Could not initialize any LLM model. Please check your API keys and model availability.")
+                if not self._fall_back(llm, e):
+                    raise
+    
+    def _fall_back(self, failed_llm, error: Exception) -> bool:
+        """Replace `failed_llm` with the next candidate model; False means the error should propagate"""
+        with self._fallback_lock:
+            if self.llm is not failed_llm:  # a concurrent call already moved on
+                return True
+            if self._llm_confirmed or not self._model_candidates or not _is_model_unavailable(error):
+                return False
+            print(f"⚠️  Model {self.model_name} failed ({error}), trying {self._model_candidates[0]}")
+            self.model_name = self._model_candidates.pop(0)
+            self.llm = _get_openrouter_llm(self.model_name)
+            return True
     
     def translate(self, query: str) -> str:
         """Main translation method that enriches the query with cost-controlled web searches"""
         print("🌐 Analyzing query for ambiguities...")
+        self.last_instructions = None
+        
+        if _AMBIG_TRIGGERS.isdisjoint(_TOKEN_RE.findall(query.lower())):
+            print("✅ No ambiguity triggers in query, skipping web analysis")
+            self._print_cost_summary()
+            return query
         
-        # Step 1: Identify ambiguous elements
-        ambiguities = self.identify_ambiguities(query)
+        # Step 1: Identify ambiguous elements (and, in the same call, a rewrite using
+        # what is already cached plus guidance steps for it)
+        ambiguities, cached_rewrite, instructions = self.analyze_and_rewrite(query)
         
         if not ambiguities:
             print("✅ No ambiguities found, query is clear")
+            self.last_instructions = instructions
             self._print_cost_summary()
             return query
         
@@ -116,6 +458,16 @@ class WebCappedTranslator:
         for ambiguity in ambiguities:
             print(f"   • {ambiguity['type']}: {ambiguity['element']}")
         
+        # Every element already resolved earlier: the fused rewrite is final, no search or rewrite call
+        if cached_rewrite and all(a.get('element', '') in self._resolution_cache for a in ambiguities):
+            print(f"\n📋 All ambiguities answered from cache")
+            print(f"\n📝 Enriched query:")
+            print(f"   Original: {query}")
+            print(f"   Enhanced: {cached_rewrite}")
+            self.last_instructions = instructions
+            self._print_cost_summary()
+            return cached_rewrite
+        
         # Step 2: Resolve ambiguities with batched web search (cost-controlled)
         clarifications = self.plan_with_limited_search(query, ambiguities)
         
@@ -139,6 +491,19 @@ class WebCappedTranslator:
         
         clarifications = {}
         
+        # Without a search backend nothing is searched: no budget spent, no extraction calls
+        if not hasattr(self, '_web_search_func'):
+            print("⚠️  No web search function available; passing search hints through")
+            return {a.get('element', ''): self._no_search_resolution(a) for a in ambiguities}
+        
+        # Same set of ambiguities resolved before in this session: reuse it, no search
+        plan_key = tuple(sorted(
+            (a.get('type', 'UNKNOWN'), " ".join(a.get('element', '').lower().split())) for a in ambiguities
+        ))
+        if plan_key in self._plan_cache:
+            print("📋 Reusing clarifications from an identical earlier plan")
+            return dict(self._plan_cache[plan_key])
+        
         # Check if we can perform any searches
         if self.search_calls >= self.max_searches:
             print(f"⚠️  Search limit reached ({self.search_calls}/{self.max_searches}). Using local reasoning for remaining ambiguities.")
@@ -153,22 +518,75 @@ class WebCappedTranslator:
             batch_resolution = self._perform_batch_search(batch_questions, ambiguities)
             if batch_resolution:
                 clarifications.update(batch_resolution)
+                self._remember_plan(plan_key, clarifications)
                 return clarifications
         
-        # Fallback: resolve individually within search limits
+        # Fallback: resolve individually within search limits. Cached elements cost nothing;
+        # slots for the rest are reserved up front so the concurrent lookups can't overshoot the cap.
+        pending = []
         for ambiguity in ambiguities:
-            if self.search_calls >= self.max_searches:
-                print(f"⚠️  Search limit reached ({self.search_calls}/{self.max_searches}). Skipping remaining ambiguities.")
-                break
-            
+            element = ambiguity.get('element', '')
+            if element in self._resolution_cache:
+                clarifications[element] = self._resolution_cache[element]
+            else:
+                pending.append(ambiguity)
+        
+        slots = min(len(pending), self.max_searches - self.search_calls)
+        if slots < len(pending):
+            print(f"⚠️  Search limit reached ({self.search_calls + slots}/{self.max_searches}). Skipping {len(pending) - slots} remaining ambiguities.")
+        if slots <= 0:
+            return clarifications
+        
+        pending = pending[:slots]
+        self.search_calls += slots
+        for ambiguity in pending:
             print(f"\n🔎 Resolving '{ambiguity['element']}'...")
-            resolution = self.resolve_with_search(ambiguity)
+        # Lookups are blocking search + LLM round-trips; overlap them on worker threads
+        with ThreadPoolExecutor(max_workers=min(len(pending), 4)) as executor:
+            resolutions = list(executor.map(self._resolve_reserved, pending))
+        
+        for ambiguity, resolution in zip(pending, resolutions):
             if resolution:
                 clarifications[ambiguity['element']] = resolution
                 print(f"✅ Resolved: {resolution[:100]}...")
         
+        # Only a complete answer is worth replaying
+        if len(clarifications) == len(ambiguities):
+            self._remember_plan(plan_key, clarifications)
         return clarifications
     
+    def _remember_plan(self, plan_key: Tuple[Tuple[str, str], ...], clarifications: Dict[str, str]):
+        """Store a resolved plan, dropping the oldest once 64 are kept"""
+        if len(self._plan_cache) >= 64:
+            self._plan_cache.pop(next(iter(self._plan_cache)))
+        self._plan_cache[plan_key] = dict(clarifications)
+    
+    def _resolve_reserved(self, ambiguity: Dict[str, str]) -> Optional[str]:
+        """Search + extraction for one ambiguity whose search slot is already reserved"""
+        element = ambiguity.get('element', '')
+        search_hint = ambiguity.get('search_hint', element)
+        
+        try:
+            if not hasattr(self, '_web_search_func'):
+                return self._no_search_resolution(ambiguity)
+            search_results = self._web_search_func(search_hint)
+            
+            results_text = _truncate_results(search_results)
+            resolution = self._extract_structured(ambiguity, results_text)
+            if resolution is None:
+                # Through _invoke so concurrent first calls get the same model fallback
+                response = self._invoke(self._extraction_prompt(ambiguity, results_text))
+                resolution = response.content.strip()
+            
+            # Cache the result
+            self._resolution_cache[element] = resolution
+            
+            return resolution
+            
+        except Exception as e:
+            print(f"Warning: Failed to resolve '{element}': {e}")
+            return None
+    
     def _format_as_batch(self, ambiguities: List[Dict[str, str]]) -> str:
         """Format multiple ambiguities into a single search question"""
         batch_elements = []
@@ -186,42 +604,24 @@ class WebCappedTranslator:
     def _perform_batch_search(self, batch_questions: str, ambiguities: List[Dict[str, str]]) -> Dict[str, str]:
         """Perform a single web search to resolve multiple ambiguities"""
         try:
-            # Use the web_search function
-            if hasattr(self, '_web_search_func'):
-                self.search_calls += 1
-                search_results = self._web_search_func(batch_questions)
-            else:
-                # Fallback for testing
-                search_results = f"Mock batch search results for: {batch_questions}"
-                self.search_calls += 1
+            # Use the web_search function; only a real outgoing search counts against the cap
+            if not hasattr(self, '_web_search_func'):
+                return {a.get('element', ''): self._no_search_resolution(a) for a in ambiguities}
+            self.search_calls += 1
+            search_results = self._web_search_func(batch_questions)
             
             # Extract relevant information for each ambiguity using LLM
-            extraction_prompt = f"""Extract relevant information from these search results to clarify each ambiguous element.
-
-Ambiguous elements to resolve:
-{json.dumps(ambiguities, indent=2)}
-
-Search results:
-{str(search_results)[:2000]}  # Limit to avoid token limits
-
-For each ambiguous element, provide a concise, factual clarification (1-2 sentences max).
-Return as JSON object with element names as keys and clarifications as values.
-
-Example format:
-{{"near Bashford Manor": "Located at 2100 Bashford Manor Ln, Louisville, KY 40207", "cheap": "Budget-friendly options under $10"}}
-
-Response (JSON only):"""
+            extraction_prompt = (
+                _BATCH_EXTRACTION_PREFIX
+                + f"Ambiguous elements to resolve:\n{json.dumps(ambiguities, indent=2)}\n\n"
+                + f"Search results:\n{_truncate_results(search_results)}\n\n"
+                + "Response (JSON only):"
+            )
 
-            response = self.llm.invoke(extraction_prompt)
+            response = self._invoke(extraction_prompt)
             content = response.content.strip()
             
-            # Clean up response
-            if '```json' in content:
-                content = content.split('```json')[1].split('```')[0]
-            elif '```' in content:
-                content = content.split('```')[1].split('```')[0]
-            
-            clarifications = json.loads(content)
+            clarifications = _json_loads(_strip_fence(content))
             
             # Cache the results
             for element, resolution in clarifications.items():
@@ -241,28 +641,79 @@ Response (JSON only):"""
         
         for ambiguity in ambiguities:
             element = ambiguity.get('element', '')
-            ambiguity_type = ambiguity.get('type', 'UNKNOWN')
             
             # Provide reasonable fallbacks based on type
-            if ambiguity_type == 'LOCATION':
-                fallback = f"Look for {element} - try searching for nearby locations or using 'find store' features"
-            elif ambiguity_type == 'SUBJECTIVE':
-                if 'cheap' in element.lower() or 'affordable' in element.lower():
-                    fallback = "Look for items under $20 or in the 'budget' section"
-                elif 'best' in element.lower() or 'good' in element.lower():
-                    fallback = "Look for highly rated items (4+ stars) or 'best seller' labels"
-                else:
-                    fallback = f"Use your best judgment for '{element}'"
-            elif ambiguity_type == 'PRODUCT':
-                fallback = f"Search for '{element}' and select the most relevant option"
-            else:
-                fallback = f"Proceed with '{element}' as specified"
+            fallback = _FALLBACKS.get(ambiguity.get('type', 'UNKNOWN'), _default_fallback)(element)
             
             fallback_clarifications[element] = fallback
             print(f"   • {element}: {fallback}")
         
         return fallback_clarifications
     
+    def analyze_and_rewrite(self, query: str) -> Tuple[List[Dict[str, str]], Optional[str], Optional[List[str]]]:
+        """Identify ambiguities, rewrite the query from cached clarifications and plan it, in one LLM call
+        
+        Returns (ambiguities, rewritten_query, instructions); the rewrite and instructions
+        are None unless every ambiguity found was answered by a clarification in the prompt.
+        """
+        # Exactly the cached resolutions for elements worded in this query
+        known = self._resolution_cache.related(query)
+        
+        prompt = f"""Analyze this user query and identify ambiguous elements that would benefit from web search clarification.
+
+Query: "{query}"
+
+Look for these types of ambiguities:
+1. LOCATION - vague location references (e.g., "near X", "local", "nearby") 
+2. SUBJECTIVE - subjective terms (e.g., "cheap", "good", "best", "popular")
+3. PRODUCT - vague product specifications (e.g., "screwdriver" without specific type)
+4. TIME_DEPENDENT - information that changes over time (e.g., "current prices", "latest")
+5. BUSINESS - store hours, specific locations, contact info needs
+
+Known clarifications (reuse these exact element names when they apply):
+{json.dumps(known, indent=2)}
+
+Also rewrite the query using the known clarifications, keeping its original intent and structure,
+and give up to 8 high-level Windows automation guidance steps for the rewritten query
+(focus on WHAT to do, not HOW to click; be specific about app names, URLs and search terms).
+
+IMPORTANT: You must respond with ONLY a valid JSON object, nothing else. No explanations, no markdown formatting.
+
+Example response:
+{{"ambiguities": [{{"type": "LOCATION", "element": "near Bashford Manor", "search_hint": "Lowe's store locations near Bashford Manor"}}], "rewritten_query": "Find a screwdriver at the Lowe's at 2100 Bashford Manor Ln, Louisville, KY", "instructions": ["Open Google Chrome browser", "Navigate to lowes.com website", "Search for screwdriver"]}}
+
+OR if no ambiguities:
+{{"ambiguities": [], "rewritten_query": "<the query unchanged>", "instructions": ["Open Notepad", "Type the requested text"]}}
+
+Response (JSON only):"""
+
+        try:
+            response = self._invoke(prompt)
+            content = response.content.strip()
+            
+            data = _json_loads(_strip_fence(content))
+            if not isinstance(data, dict):
+                return [], None, None
+            ambiguities = data.get('ambiguities')
+            ambiguities = ambiguities if isinstance(ambiguities, list) else []
+            rewritten = data.get('rewritten_query')
+            instructions = data.get('instructions')
+            if isinstance(instructions, list):
+                instructions = [str(step) for step in instructions if step][:8] or None
+            else:
+                instructions = None
+            # An element without a clarification in the prompt was rewritten blind
+            known_keys = {ResolutionCache._key(element) for element in known}
+            if any(ResolutionCache._key(a.get('element', '')) not in known_keys for a in ambiguities):
+                return ambiguities, None, None
+            return (ambiguities,
+                    rewritten.strip() if isinstance(rewritten, str) and rewritten.strip() else None,
+                    instructions)
+            
+        except Exception as e:
+            print(f"Warning: Failed to identify ambiguities: {e}")
+            return [], None, None
+    
     def identify_ambiguities(self, query: str) -> List[Dict[str, str]]:
         """Detect elements in the query that need clarification"""
         
@@ -288,16 +739,10 @@ OR if no ambiguities:
 Response (JSON only):"""
 
         try:
-            response = self.llm.invoke(prompt)
+            response = self._invoke(prompt)
             content = response.content.strip()
             
-            # Clean up response
-            if '```json' in content:
-                content = content.split('```json')[1].split('```')[0]
-            elif '```' in content:
-                content = content.split('```')[1].split('```')[0]
-            
-            ambiguities = json.loads(content)
+            ambiguities = _json_loads(_strip_fence(content))
             return ambiguities if isinstance(ambiguities, list) else []
             
         except Exception as e:
@@ -320,29 +765,19 @@ Response (JSON only):"""
             return None
         
         try:
-            # Use the web_search function that's available in the environment
-            if hasattr(self, '_web_search_func'):
-                self.search_calls += 1
-                search_results = self._web_search_func(search_hint)
-            else:
-                # Fallback for testing
-                search_results = f"Mock search results for: {search_hint}"
-                self.search_calls += 1
+            # Use the web_search function that's available in the environment;
+            # only a real outgoing search counts against the cap
+            if not hasattr(self, '_web_search_func'):
+                return self._no_search_resolution(ambiguity)
+            self.search_calls += 1
+            search_results = self._web_search_func(search_hint)
             
-            # Extract relevant information using LLM
-            extraction_prompt = f"""Extract relevant information from these search results to clarify the ambiguous element.
-
-Ambiguous element: "{element}"
-Type: {ambiguity.get('type', 'UNKNOWN')}
-Search query was: "{search_hint}"
-
-Search results:
-{str(search_results)[:2000]}  # Limit to avoid token limits
-
-Provide a concise, factual clarification (1-2 sentences max) that would help someone complete the task:"""
-
-            response = self.llm.invoke(extraction_prompt)
-            resolution = response.content.strip()
+            # Extract relevant information, by pattern when possible, otherwise with the LLM
+            results_text = _truncate_results(search_results)
+            resolution = self._extract_structured(ambiguity, results_text)
+            if resolution is None:
+                response = self._invoke(self._extraction_prompt(ambiguity, results_text))
+                resolution = response.content.strip()
             
             # Cache the result
             self._resolution_cache[element] = resolution
@@ -353,27 +788,65 @@ Provide a concise, factual clarification (1-2 sentences max) that would help som
             print(f"Warning: Failed to resolve '{element}': {e}")
             return None
     
+    @staticmethod
+    def _no_search_resolution(ambiguity: Dict[str, str]) -> str:
+        """Placeholder clarification when no search backend is attached (not cached)"""
+        return f"(no search available) {ambiguity.get('search_hint', ambiguity.get('element', ''))}"
+    
+    def _extract_structured(self, ambiguity: Dict[str, str], results_text: str) -> Optional[str]:
+        """Pull an address/hours/phone straight from the search results for LOCATION and BUSINESS elements
+        
+        The field is chosen from the element and search hint wording (a LOCATION
+        element with no field words means its address). Only results that mention
+        the hint's distinctive words are searched, so another store's details aren't
+        picked up. Returns None, leaving it to LLM extraction, when nothing fits.
+        """
+        ambiguity_type = ambiguity.get('type', '')
+        if ambiguity_type not in _STRUCTURED_TYPES:
+            return None
+        element = ambiguity.get('element', '')
+        wording = f"{element} {ambiguity.get('search_hint', '')}"
+        field = next((f for f in _STRUCTURED_FIELDS if f[1].search(wording)), None)
+        if field is None:
+            if ambiguity_type != 'LOCATION':
+                return None
+            field = _STRUCTURED_FIELDS[-1]
+        label, _, pattern = field
+        
+        subject = {t for t in _TOKEN_RE.findall(wording.lower()) if len(t) > 3 and t not in _GENERIC_HINT_WORDS}
+        for line in results_text.splitlines():  # one search result per line
+            if subject and subject.isdisjoint(_TOKEN_RE.findall(line.lower())):
+                continue
+            match = pattern.search(line)
+            if match:
+                return f"{label} {match.group(0).strip()}"
+        return None
+    
+    def _extraction_prompt(self, ambiguity: Dict[str, str], results_text: str) -> str:
+        """Build the single-element extraction prompt"""
+        element = ambiguity.get('element', '')
+        search_hint = ambiguity.get('search_hint', element)
+        return (
+            _EXTRACTION_PREFIX
+            + f'Ambiguous element: "{element}"\n'
+            + f"Type: {ambiguity.get('type', 'UNKNOWN')}\n"
+            + f'Search query was: "{search_hint}"\n\n'
+            + f"Search results:\n{results_text}\n\n"
+            + "Clarification:"
+        )
+    
     def rewrite_query(self, original_query: str, clarifications: Dict[str, str]) -> str:
         """Create a precise, enriched query"""
         
-        prompt = f"""Rewrite this query by incorporating the clarifications while maintaining the original intent.
-
-Original query: "{original_query}"
-
-Clarifications:
-{json.dumps(clarifications, indent=2)}
-
-Rules:
-1. Replace ambiguous elements with specific information
-2. Add helpful context that guides the agent
-3. Keep the same overall structure and intent
-4. Make it more actionable and specific
-5. Don't make it overly long - just more precise
-
-Rewritten query:"""
+        prompt = (
+            _REWRITE_PREFIX
+            + f'Original query: "{original_query}"\n\n'
+            + f"Clarifications:\n{json.dumps(clarifications, indent=2)}\n\n"
+            + "Rewritten query:"
+        )
 
         try:
-            response = self.llm.invoke(prompt)
+            response = self._invoke(prompt)
             enriched_query = response.content.strip()
             
             # Remove any quotes that might wrap the response
@@ -394,10 +867,10 @@ Rewritten query:"""
             print("   Using cached information or fallback reasoning...")
             
             # Try to answer from cached information first
-            for cached_element, cached_resolution in self._resolution_cache.items():
-                if any(word in question.lower() for word in cached_element.lower().split()):
-                    print(f"📋 Found cached info: {cached_resolution}")
-                    return cached_resolution
+            cached = self._resolution_cache.match(question)
+            if cached:
+                print(f"📋 Found cached info: {cached[1]}")
+                return cached[1]
             
             # Provide generic fallback
             return "Please proceed with your best judgment. Web search is disabled during execution to control costs."
@@ -409,8 +882,13 @@ Rewritten query:"""
     def _print_cost_summary(self):
         """Print cost summary as required by the ticket"""
         estimated_cost = self.search_calls * ESTIMATED_COST_PER_SEARCH
+        lifetime_calls = self._resolution_cache.add_to_counter(
+            "web_search_calls", self.search_calls - self._search_calls_recorded
+        )
+        self._search_calls_recorded = self.search_calls
         print(f"\n💰 [cost] web_search_calls={self.search_calls}/{self.max_searches} "
-              f"~est=${estimated_cost:.2f} (OpenRouter web plugin)")
+              f"~est=${estimated_cost:.2f} (OpenRouter web plugin) | "
+              f"lifetime={lifetime_calls} ~${lifetime_calls * ESTIMATED_COST_PER_SEARCH:.2f}")
 
 
 class TaskAnalyzer:
@@ -418,17 +896,7 @@ class TaskAnalyzer:
     
     def __init__(self):
         # Use Qwen for cheap analysis
-        self.llm = ChatOpenAI(
-            model="qwen/qwen-2.5-72b-instruct",
-            temperature=0.1,
-            max_tokens=500,
-            api_key=os.getenv("OPENROUTER_API_KEY"),
-            base_url="https://openrouter.ai/api/v1",
-            default_headers={
-                "HTTP-Referer": os.getenv("OPENROUTER_HTTP_REFERER", "https://github.com/windows-use"),
-                "X-Title": os.getenv("OPENROUTER_X_TITLE", "Windows-Use Web Capped")
-            }
-        )
+        self.llm = _get_openrouter_llm("qwen/qwen-2.5-72b-instruct", max_tokens=500)
     
     def analyze(self, query: str) -> List[str]:
         """Convert user query into specific step-by-step instructions"""
@@ -453,19 +921,27 @@ Return ONLY a JSON array of guidance steps, like:
 
 Steps:"""
 
-        response = self.llm.invoke(prompt)
-        return self._parse_instructions(response.content)
+        # Stream and stop reading as soon as the top-level JSON array closes; any commentary
+        # the model adds after it would be thrown away by the parser anyway
+        parts = []
+        scanner = ArrayScanner()
+        stream = self.llm.stream(prompt)
+        try:
+            for chunk in stream:
+                end = scanner.feed(chunk.content)
+                if end is not None:
+                    parts.append(chunk.content[:end])
+                    break
+                parts.append(chunk.content)
+        finally:
+            stream.close()
+        
+        return self._parse_instructions("".join(parts))
     
     def _parse_instructions(self, content: str) -> List[str]:
         """Extract instructions from LLM response"""
         try:
-            # Clean up response
-            if '```json' in content:
-                content = content.split('```json')[1].split('```')[0]
-            elif '```' in content:
-                content = content.split('```')[1].split('```')[0]
-            
-            instructions = json.loads(content.strip())
+            instructions = _json_loads(_strip_fence(content))
             # Ensure it's a list and cap at 8 instructions
             if isinstance(instructions, list):
                 return instructions[:8]
@@ -477,9 +953,9 @@ Steps:"""
             instructions = []
             for line in lines:
                 line = line.strip()
-                if line and (line.startswith('"') or line.startswith('- ') or re.match(r'^\d+\.', line)):
+                if line and (line.startswith('"') or line.startswith('- ') or _NUM_PREFIX.match(line)):
                     # Clean up the line
-                    line = re.sub(r'^[\d\.\-"\s]+', '', line).strip(' ".,')
+                    line = _LEAD_JUNK.sub('', line).strip(' ".,')
                     if line:
                         instructions.append(line)
             return instructions[:8]
@@ -493,11 +969,8 @@ class WebCappedSmartWindowsAgent:
         self.translator = WebCappedTranslator(model_name=translation_model, max_searches=max_searches)
         self.analyzer = TaskAnalyzer()
         
-        # Use cheapest model for execution
-        self.executor_llm = ChatGoogleGenerativeAI(
-            model='gemini-2.5-flash-lite',
-            temperature=0.0
-        )
+        # Use cheapest model for execution (shared across agent instances)
+        self.executor_llm = _get_executor_llm()
         
         # Set up web search function
         if web_search_func:
@@ -509,36 +982,42 @@ class WebCappedSmartWindowsAgent:
     def execute(self, query: str) -> str:
         """Execute task with web-capped translation and instruction generation"""
         
-        print("="*80)
-        print(f"WEB-CAPPED SMART WINDOWS AGENT")
-        print("="*80)
-        print(f"Task: {query}")
-        print(f"Search limit: {self.translator.max_searches} calls per task")
-        print("-"*80)
+        sys.stdout.write(
+            f"{BAR80}\nWEB-CAPPED SMART WINDOWS AGENT\n{BAR80}\n"
+            f"Task: {query}\n"
+            f"Search limit: {self.translator.max_searches} calls per task\n"
+            f"{RULE80}\n"
+        )
         
         # Step 1: Web-capped translation
         enriched_query = self.translator.translate(query)
         
-        # Step 2: Generate instructions from enriched query
-        print("\n🔍 Analyzing enriched task...")
-        instructions = self.analyzer.analyze(enriched_query)
+        # Step 2: Generate instructions from enriched query, unless the planning call
+        # already produced them (no search was needed)
+        instructions = self.translator.last_instructions
+        if instructions:
+            print("\n🔍 Using guidance steps from the planning call")
+        else:
+            print("\n🔍 Analyzing enriched task...")
+            instructions = self.analyzer.analyze(enriched_query)
         
         if not instructions:
             print("❌ Failed to understand task")
             return "Failed to understand task"
         
-        print(f"\n📋 Generated {len(instructions)} instructions:")
-        for i, inst in enumerate(instructions, 1):
-            print(f"   {i}. {inst}")
+        listing = "".join(f"   {i}. {inst}\n" for i, inst in enumerate(instructions, 1))
+        sys.stdout.write(f"\n📋 Generated {len(instructions)} instructions:\n{listing}")
         
         # Step 3: Execute with Windows-Use (NO WEB SEARCH DURING EXECUTION)
-        print(f"\n🤖 Executing with Windows-Use agent...")
-        print(f"   Model: gemini-2.5-flash-lite")
-        print(f"   Vision: False")
-        print(f"   Max steps: 30")
-        print(f"   Web-enhanced: Capped (planning-only)")
-        print(f"   Mid-task search: DISABLED")
-        print("\n" + "-"*80)
+        sys.stdout.write(
+            "\n🤖 Executing with Windows-Use agent...\n"
+            "   Model: gemini-2.5-flash-lite\n"
+            "   Vision: False\n"
+            "   Max steps: 30\n"
+            "   Web-enhanced: Capped (planning-only)\n"
+            "   Mid-task search: DISABLED\n"
+            f"\n{RULE80}\n"
+        )
         
         try:
             agent = EnhancedAgent(
@@ -556,14 +1035,13 @@ class WebCappedSmartWindowsAgent:
             
             result = agent.invoke(enriched_query)
             
-            print("-"*80)
+            print(RULE80)
             
             if result.error:
                 print(f"\n❌ Execution error: {result.error}")
                 return f"Error: {result.error}"
             
-            print(f"\n✅ Task completed successfully")
-            print(f"✅ Zero mid-task searches performed (cost-capped mode)")
+            sys.stdout.write("\n✅ Task completed successfully\n✅ Zero mid-task searches performed (cost-capped mode)\n")
             return result.content or "Task completed successfully"
             
         except Exception as e:
@@ -573,15 +1051,19 @@ class WebCappedSmartWindowsAgent:
 
 def main():
     """Main entry point with cost-capped web search"""
-    print("Web-Capped Smart Windows Agent (Support Ticket A)")
-    print("Features: Planning-only search, hard caps, batching, cost tracking")
-    print(f"Search limit: {MAX_PLANNING_SEARCHES} calls per task (est. ${MAX_PLANNING_SEARCHES * ESTIMATED_COST_PER_SEARCH:.2f} max)")
-    print("Models: GPT-4o Mini Search Preview :online (translation), Qwen 72B (analysis), Gemini Flash Lite (execution)")
-    print("Best for cost-controlled tasks with moderate ambiguity resolution needs")
-    print()
+    sys.stdout.write(
+        "Web-Capped Smart Windows Agent (Support Ticket A)\n"
+        "Features: Planning-only search, hard caps, batching, cost tracking\n"
+        f"Search limit: {MAX_PLANNING_SEARCHES} calls per task (est. ${MAX_PLANNING_SEARCHES * ESTIMATED_COST_PER_SEARCH:.2f} max)\n"
+        "Models: GPT-4o Mini Search Preview :online (translation), Qwen 72B (analysis), Gemini Flash Lite (execution)\n"
+        "Best for cost-controlled tasks with moderate ambiguity resolution needs\n"
+        "\n"
+    )
     
     # Create web search function
     try:
+        from web_search import create_web_search_function
+        
         web_search_func = create_web_search_function(
             api="openrouter_online",
             cache_results=True,
@@ -603,10 +1085,7 @@ def main():
     # Execute with cost-capped web enhancement
     result = agent.execute(query)
     
-    print("\n" + "="*80)
-    print("FINAL RESULT:")
-    print("="*80)
-    print(result)
+    sys.stdout.write(f"\n{BAR80}\nFINAL RESULT:\n{BAR80}\n{result}\n")
 
 
 if __name__ == "__main__":
@@ -8,7 +8,7 @@ Key Features:
 - Uses Serper Google SERP API for both planning AND runtime searches
 - VERY liberal search limits (8 planning + 5 runtime by default)
 - Environment variable first configuration (SERPER_API_KEY)
-- In-memory LRU caching for repeated queries
+- In-memory LRU caching for repeated queries, backed by a 24h disk cache (.cache/serper)
 - Cost tracking and estimation using Serper pricing
 - Mid-task clarification enabled (it's so cheap!)
 
@@ -19,90 +19,279 @@ Cost: ~$0.002 per task (vs ~$0.006 with OpenRouter) - Liberal usage mode!
 """
 
 import argparse
+import atexit
+import hashlib
 import json
 import os
 import re
+import sys
+import threading
 import time
+from collections import Counter, OrderedDict, defaultdict
+from concurrent.futures import ThreadPoolExecutor
 from functools import lru_cache
-from typing import List, Dict, Any, Optional, Callable
+from pathlib import Path
+from typing import TYPE_CHECKING, List, Dict, Any, Optional, Callable, Tuple
 
 import requests
-from langchain_openai import ChatOpenAI
-from langchain_google_genai import ChatGoogleGenerativeAI
-from windows_use.agent.enhanced_service import EnhancedAgent
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from dotenv import load_dotenv
 
+# langchain and the agent stack are imported where first needed so --help and
+# config errors don't pay their import time
+if TYPE_CHECKING:
+    from langchain_openai import ChatOpenAI
+
+try:  # optional faster JSON codec; falls back to the stdlib
+    import orjson
+
+    _dumpb = orjson.dumps
+    _loads = orjson.loads
+except ImportError:
+    def _dumpb(obj: Any) -> bytes:
+        return json.dumps(obj).encode()
+
+    _loads = json.loads
+
 # Serper Configuration
 SERPER_PRICE_PER_QUERY = 0.0003  # $0.30 / 1000 queries (starter tier)
 DEFAULT_MAX_PLANNING_SEARCHES = 8  # Very liberal - it's super cheap!
 DEFAULT_MAX_RUNTIME_SEARCHES = 5   # Allow mid-task searches too
 ALLOW_RUNTIME_SEARCH = True  # It's cheap, let's use it!
 
-# Global search call counter
+# Console banner; each banner block is emitted with a single write
+BAR60 = "=" * 60
+
+# Static prompt text; only the query-specific parts are formatted per call
+_IDENTIFY_PROMPT_HEAD = """Analyze this user query and identify ambiguous elements that would benefit from web search clarification.
+
+"""
+_IDENTIFY_PROMPT_TAIL = """Look for these types of ambiguities:
+1. LOCATION - vague location references (e.g., "near X", "local", "nearby") 
+2. SUBJECTIVE - subjective terms (e.g., "cheap", "good", "best", "popular")
+3. PRODUCT - vague product specifications (e.g., "screwdriver" without specific type)
+4. TIME_DEPENDENT - information that changes over time (e.g., "current prices", "latest")
+5. BUSINESS - store hours, specific locations, contact info needs
+
+IMPORTANT: You must respond with ONLY a valid JSON object, nothing else. No explanations, no markdown formatting.
+The object has two keys:
+- "ambiguities": the list of ambiguous elements
+- "rewrite": if there are NO ambiguities, the query rewritten to be precise and actionable (same intent, not overly long); otherwise ""
+
+Example responses:
+{"ambiguities": [{"type": "LOCATION", "element": "near downtown", "search_hint": "Best Buy store locations near downtown Louisville Kentucky"}, {"type": "SUBJECTIVE", "element": "best rated", "search_hint": "best rated wireless gaming headsets under $150"}], "rewrite": ""}
+
+OR if no ambiguities:
+{"ambiguities": [], "rewrite": "Open Notepad and type 'Hello World'"}
+
+Response (JSON only):"""
+
+_EXTRACTION_PROMPT_HEAD = """Extract relevant information from these search results to clarify the ambiguous elements.
+
+"""
+_EXTRACTION_PROMPT_TAIL = "Provide concise, factual clarifications (1-2 sentences each) that would help someone complete the task:"
+
+_REWRITE_PROMPT_HEAD = """Rewrite this query by incorporating the clarifications while maintaining the original intent.
+
+"""
+_REWRITE_PROMPT_TAIL = """Rules:
+1. Replace ambiguous elements with specific information
+2. Add helpful context that guides the agent
+3. Keep the same overall structure and intent
+4. Make it more actionable and specific
+5. Don't make it overly long - just more precise
+
+Rewritten query:"""
+
+_ANSWER_PROMPT_HEAD = """Answer this specific question based on the search results:
+
+"""
+_ANSWER_PROMPT_TAIL = "Provide a direct, helpful answer (1-2 sentences) that would help the Windows automation agent:"
+
+_ANALYZE_PROMPT_HEAD = """You are a Windows automation expert. Convert this request into clear guidance steps.
+
+RULES:
+- Focus on WHAT to do, not HOW to click (the agent knows how to click)
+- Be specific about app names and URLs
+- Include key search terms and button names
+- Maximum 8 high-level steps
+- Each step should guide towards the goal
+
+"""
+_ANALYZE_PROMPT_TAIL = """Return ONLY a JSON array of guidance steps, like:
+["Open Google Chrome browser",
+ "Navigate to bestbuy.com website",
+ "Search for wireless gaming headset PS5",
+ "Filter by price under $150 and ratings",
+ "Select highly rated option and add to cart"]
+
+Steps:"""
+
+# Resolutions kept per translator before the least recently used is evicted
+RESOLUTION_CACHE_MAX = 256
+
+# Words indexed for matching mid-task questions to cached resolutions; the
+# stopwords are too common to tie a question to any particular resolution
+_WORD_RE = re.compile(r"\w+")
+_STOPWORDS = frozenset(
+    "a an and are at be can do does for from how i in is it its me my near of on or "
+    "the this to what when where which who with".split()
+)
+
+def _index_words(text: str) -> set:
+    return {w for w in _WORD_RE.findall(text.lower()) if w not in _STOPWORDS}
+
+# Leading quote/bullet/numbering stripped from fallback instruction lines
+_LIST_PREFIX_RE = re.compile(r'^["\'\-*\d\.\)]\s*')
+
+# Global search call counter; searches may run on worker threads, so guard it
 search_calls = 0
+_search_calls_lock = threading.Lock()
+
+def _bump_search_calls():
+    global search_calls
+    with _search_calls_lock:
+        search_calls += 1
 
-def serper_search(query: str, api_key: str, num: int = 5) -> dict:
+def get_search_calls() -> int:
+    with _search_calls_lock:
+        return search_calls
+
+SERPER_SEARCH_URL = "https://google.serper.dev/search"
+
+# On-disk response cache so repeat queries are free across sessions
+SERPER_CACHE_DIR = Path(".cache/serper")
+SERPER_CACHE_TTL_S = 86400
+
+# Shared keep-alive session so repeat searches reuse one TLS connection
+_SESSION = requests.Session()
+_SESSION.headers.update({"Content-Type": "application/json"})
+_SESSION.mount("https://", HTTPAdapter(
+    pool_connections=4,
+    pool_maxsize=8,
+    max_retries=Retry(total=2, backoff_factor=0.2, status_forcelist=[429, 502, 503, 504], allowed_methods=None),
+))
+
+def serper_search(query: str, api_key: str, num: int = 5) -> bytes:
     """
     Search using Serper's Google SERP API
-    Returns structured search results similar to OpenRouter format
+    Returns the raw JSON response body; decoding is left to the caller
     """
-    global search_calls
-    search_calls += 1
+    _bump_search_calls()
     
     try:
-        response = requests.post(
-            "https://google.serper.dev/search",
-            headers={
-                "X-API-KEY": api_key,
-                "Content-Type": "application/json"
-            },
-            json={"q": query, "num": num},
+        response = _SESSION.post(
+            SERPER_SEARCH_URL,
+            headers={"X-API-KEY": api_key},
+            data=_dumpb({"q": query, "num": num}),  # Content-Type set on the session
             timeout=15
         )
         response.raise_for_status()
-        data = response.json()
-        
-        # Convert Serper format to our normalized format
-        results = []
-        organic = data.get('organic', [])
-        
-        for result in organic[:num]:
-            results.append({
-                "title": result.get('title', ''),
-                "url": result.get('link', ''),
-                "snippet": result.get('snippet', ''),
-                "source": "serper"
-            })
-        
-        return {
-            "results": results,
-            "count": len(results)
-        }
+        return response.content
         
     except Exception as e:
         print(f"Warning: Serper search failed: {e}")
-        return {"results": [], "count": 0}
+        return b"{}"
 
-@lru_cache(maxsize=64)
-def cached_serper_search(query: str, api_key: str, num: int = 5) -> str:
-    """
-    LRU cached version of Serper search
-    Returns JSON string for caching compatibility
-    """
-    result = serper_search(query, api_key, num)
-    return json.dumps(result)
+def _disk_cache_get(key: str) -> Optional[bytes]:
+    p = SERPER_CACHE_DIR / f"{key}.json"
+    try:
+        if (time.time() - p.stat().st_mtime) > SERPER_CACHE_TTL_S:
+            return None
+        return p.read_bytes()
+    except OSError:
+        return None
+
+def _disk_cache_set(key: str, data: bytes) -> None:
+    try:
+        SERPER_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+        (SERPER_CACHE_DIR / f"{key}.json").write_bytes(data)
+    except OSError as e:
+        print(f"Warning: Could not write Serper cache: {e}")
+
+def _summarize_results(search_results: Dict[str, Any], limit: int = 5) -> str:
+    """Render the leading results as '- title: snippet' lines; far fewer prompt tokens than indented JSON"""
+    return "\n".join(f"- {r.get('title', '')}: {r.get('snippet', '')}" for r in search_results.get("results", [])[:limit])
+
+class _SerperSearchFailed(RuntimeError):
+    """Raised inside the cached lookup so a failed search is never memoized"""
 
 def create_serper_search_function(api_key: str, max_results: int = 5) -> Callable[[str], Dict[str, Any]]:
     """
-    Create a search function that uses Serper with LRU caching
+    Create a search function that uses Serper with LRU caching in front of a disk cache
+    The cache is keyed on the normalized query only; api_key is fixed per closure
     """
+    @lru_cache(maxsize=256)
+    def _cached(norm_query: str, num: int) -> bytes:
+        # Raw response bytes, so cache hits skip a re-encode
+        key = hashlib.md5(f"{norm_query}|{num}".encode("utf-8")).hexdigest()
+        data = _disk_cache_get(key)
+        if data is None:
+            data = serper_search(norm_query, api_key, num)
+            if data == b"{}":  # neither cache layer keeps failed searches
+                raise _SerperSearchFailed(norm_query)
+            _disk_cache_set(key, data)
+        return data
+    
     def search_func(query: str) -> Dict[str, Any]:
-        cached_result = cached_serper_search(query, api_key, max_results)
-        return json.loads(cached_result)
+        norm = " ".join(query.lower().split())
+        try:
+            data = _loads(_cached(norm, max_results))
+        except _SerperSearchFailed:
+            data = {}  # already reported by serper_search; the next call retries
+        
+        # Convert Serper format to our normalized format
+        results = [
+            {"title": r.get('title', ''), "url": r.get('link', ''), "snippet": r.get('snippet', ''), "source": "serper"}
+            for r in data.get('organic', [])[:max_results]
+        ]
+        
+        # Serper's direct answers, when present, need no LLM extraction
+        answer_box = data.get('answerBox') or {}
+        answer = (
+            answer_box.get('answer')
+            or answer_box.get('snippet')
+            or (data.get('knowledgeGraph') or {}).get('description')
+        )
+        
+        return {
+            "results": results,
+            "count": len(results),
+            "answer_box": answer
+        }
     
     return search_func
 
 
+@lru_cache(maxsize=8)
+def _get_openrouter_chat(model: str) -> 'ChatOpenAI':
+    """Shared OpenRouter client per model so the analyzer and translator reuse one connection pool"""
+    from langchain_openai import ChatOpenAI
+    
+    return ChatOpenAI(
+        model=model,
+        temperature=0.1,
+        max_tokens=800,
+        api_key=os.getenv("OPENROUTER_API_KEY"),
+        base_url="https://openrouter.ai/api/v1",
+        default_headers={
+            "HTTP-Referer": os.getenv("OPENROUTER_HTTP_REFERER", "https://github.com/windows-use"),
+            "X-Title": os.getenv("OPENROUTER_X_TITLE", "Windows-Use Serper Enhanced")
+        }
+    )
+
+
+def _is_model_unavailable(error: Exception) -> bool:
+    """True when the error says the model itself can't be used (unknown or unavailable id)
+    
+    Transient failures such as rate limits and timeouts return False, so they
+    don't push the translator onto a fallback model for the rest of the run.
+    """
+    status = getattr(error, "status_code", None)
+    return status == 404 or (status == 400 and "model" in str(error).lower())
+
+
 class SerperWebEnhancedTranslator:
     """Web-enhanced translation layer using Serper for cheap, liberal searches"""
     
@@ -112,6 +301,10 @@ class SerperWebEnhancedTranslator:
             model_name = "qwen/qwen-2.5-72b-instruct"
         
         self.model_name = model_name
+        self._model_candidates: List[str] = []
+        self._llm_confirmed = False
+        # Extraction calls run on worker threads; one of them advances the fallback
+        self._fallback_lock = threading.Lock()
         self.llm = self._initialize_llm(model_name)
         self.serper_key = serper_key
         self.max_planning_searches = max_planning_searches
@@ -123,7 +316,11 @@ class SerperWebEnhancedTranslator:
         self.search_func = create_serper_search_function(serper_key)
         
         # Cache for resolved information to avoid duplicate searches
-        self._resolution_cache: Dict[str, str] = {}
+        self._resolution_cache: "OrderedDict[str, str]" = OrderedDict()
+        # Inverted word -> cache key index for mid-task lookups
+        self._word_index: Dict[str, set] = defaultdict(set)
+        # Batch resolutions are cached from worker threads
+        self._cache_lock = threading.RLock()
         
         # Callback for mid-task clarification (set by parent agent)
         self.mid_task_callback: Optional[Callable[[str], str]] = None
@@ -145,59 +342,78 @@ class SerperWebEnhancedTranslator:
                 unique_models.append(model)
                 seen.add(model)
         
-        for model in unique_models:
+        # No test completion here; the first real call validates the model and
+        # _invoke moves on to the next candidate if it turns out to be unavailable
+        self.model_name = unique_models[0]
+        self._model_candidates = unique_models[1:]
+        print(f"🤖 Using model: {self.model_name} (unverified until the first call)")
+        return _get_openrouter_chat(self.model_name)
+    
+    def _invoke(self, prompt: str):
+        """Invoke the LLM, moving on to the next candidate model if the first real call finds it unavailable"""
+        while True:
+            llm = self.llm
             try:
-                print(f"🤖 Trying model: {model}")
-                llm = ChatOpenAI(
-                    model=model,
-                    temperature=0.1,
-                    max_tokens=800,
-                    api_key=os.getenv("OPENROUTER_API_KEY"),
-                    base_url="https://openrouter.ai/api/v1",
-                    default_headers={
-                        "HTTP-Referer": os.getenv("OPENROUTER_HTTP_REFERER", "https://github.com/windows-use"),
-                        "X-Title": os.getenv("OPENROUTER_X_TITLE", "Windows-Use Serper Enhanced")
-                    }
-                )
-                
-                # Test the model with a simple query
-                test_response = llm.invoke("Test")
-                print(f"✅ Successfully initialized: {model}")
-                self.model_name = model
-                return llm
-                
+                response = llm.invoke(prompt)
+                self._llm_confirmed = True
+                return response
             except Exception as e:
-                print(f"⚠️  Failed to initialize {model}: {str(e)}")
-                continue
-        
-        raise Exception("Could not initialize any LLM model. Please check your API keys and model availability.")
+                if not self._fall_back(llm, e):
+                    raise
+    
+    def _fall_back(self, failed_llm, error: Exception) -> bool:
+        """Replace `failed_llm` with the next candidate model; False means the error should propagate"""
+        with self._fallback_lock:
+            if self.llm is not failed_llm:  # a concurrent call already moved on
+                return True
+            if self._llm_confirmed or not self._model_candidates or not _is_model_unavailable(error):
+                return False
+            print(f"⚠️  Model {self.model_name} failed ({error}), trying {self._model_candidates[0]}")
+            self.model_name = self._model_candidates.pop(0)
+            self.llm = _get_openrouter_chat(self.model_name)
+            return True
     
     def translate(self, query: str) -> str:
         """Main translation method with liberal Serper planning searches"""
         print("🌐 Analyzing query for ambiguities...")
         
-        # Step 1: Identify ambiguous elements
-        ambiguities = self.identify_ambiguities(query)
+        # Step 1: Identify ambiguous elements (clear queries come back already rewritten)
+        ambiguities, rewrite = self.identify_ambiguities(query)
         
         if not ambiguities:
             print("✅ No ambiguities found, query is clear")
-            return query
+            return rewrite or query
         
         print(f"🔍 Found {len(ambiguities)} ambiguous elements:")
         for ambiguity in ambiguities:
             print(f"   • {ambiguity['type']}: {ambiguity['element']}")
         
         # Step 2: Resolve ambiguities with Serper searches (more liberal batching)
-        clarifications = {}
+        clarifications: List[str] = []
         batches = self._batch_ambiguities(ambiguities, target_batches=2)
         
+        # Prefetch every uncached batch that fits under the cap concurrently;
+        # the searches are independent and I/O bound
+        remaining = max(0, self.max_planning_searches - self.planning_search_calls)
+        to_search = [b for b in batches if b not in self._resolution_cache][:remaining]
+        prefetched = {}
+        if to_search:
+            self.planning_search_calls += len(to_search)
+            with ThreadPoolExecutor(max_workers=min(len(to_search), 4)) as ex:
+                prefetched = dict(zip(to_search, ex.map(self.search_func, to_search)))
+        
+        runnable = []
         for batch_query in batches:
-            if self.planning_search_calls >= self.max_planning_searches:
+            if batch_query not in self._resolution_cache and batch_query not in prefetched:
                 print(f"⚠️  Reached max planning searches ({self.max_planning_searches}), skipping remaining")
                 break
                 
             print(f"\n🔎 Batch search: '{batch_query[:60]}...'")
-            resolution = self.resolve_batch_with_search(batch_query)
+            runnable.append(batch_query)
+        
+        # Overlap the per-batch extraction calls
+        resolutions = self._resolve_batches(runnable, batches, prefetched)
+        for batch_query, resolution in zip(runnable, resolutions):
             if resolution:
                 # Parse batch results back to individual clarifications
                 self._extract_batch_clarifications(batch_query, resolution, clarifications)
@@ -212,32 +428,17 @@ class SerperWebEnhancedTranslator:
         
         return query
     
-    def identify_ambiguities(self, query: str) -> List[Dict[str, str]]:
-        """Detect elements in the query that need clarification"""
+    def identify_ambiguities(self, query: str) -> Tuple[List[Dict[str, str]], Optional[str]]:
+        """Detect elements in the query that need clarification
         
-        prompt = f"""Analyze this user query and identify ambiguous elements that would benefit from web search clarification.
-
-Query: "{query}"
-
-Look for these types of ambiguities:
-1. LOCATION - vague location references (e.g., "near X", "local", "nearby") 
-2. SUBJECTIVE - subjective terms (e.g., "cheap", "good", "best", "popular")
-3. PRODUCT - vague product specifications (e.g., "screwdriver" without specific type)
-4. TIME_DEPENDENT - information that changes over time (e.g., "current prices", "latest")
-5. BUSINESS - store hours, specific locations, contact info needs
-
-IMPORTANT: You must respond with ONLY a valid JSON array, nothing else. No explanations, no markdown formatting.
-
-Example responses:
-[{{"type": "LOCATION", "element": "near downtown", "search_hint": "Best Buy store locations near downtown Louisville Kentucky"}}, {{"type": "SUBJECTIVE", "element": "best rated", "search_hint": "best rated wireless gaming headsets under $150"}}]
-
-OR if no ambiguities:
-[]
-
-Response (JSON only):"""
+        Returns (ambiguities, rewrite); rewrite is only filled in when the
+        query is already clear, saving the separate rewrite_query call
+        """
+        
+        prompt = f'{_IDENTIFY_PROMPT_HEAD}Query: "{query}"\n\n{_IDENTIFY_PROMPT_TAIL}'
 
         try:
-            response = self.llm.invoke(prompt)
+            response = self._invoke(prompt)
             content = response.content.strip()
             
             # Clean up response
@@ -246,55 +447,90 @@ Response (JSON only):"""
             elif '```' in content:
                 content = content.split('```')[1].split('```')[0]
             
-            ambiguities = json.loads(content)
-            return ambiguities if isinstance(ambiguities, list) else []
+            parsed = _loads(content)
+            if isinstance(parsed, list):  # tolerate a bare ambiguity array
+                return parsed, None
+            if not isinstance(parsed, dict):
+                return [], None
+            
+            ambiguities = parsed.get("ambiguities")
+            rewrite = parsed.get("rewrite")
+            if isinstance(rewrite, str):
+                rewrite = rewrite.strip().strip('"') or None
+            else:
+                rewrite = None
+            return (ambiguities if isinstance(ambiguities, list) else []), rewrite
             
         except Exception as e:
             print(f"Warning: Failed to identify ambiguities: {e}")
-            return []
+            return [], None
     
-    def _batch_ambiguities(self, ambiguities: List[Dict[str, str]], target_batches: int = 2) -> List[str]:
-        """Create fewer, larger search batches for more efficient Serper usage"""
+    def _batch_ambiguities(self, ambiguities: List[Dict[str, str]], target_batches: int = 2) -> Dict[str, int]:
+        """Create fewer, larger search batches for more efficient Serper usage
+        
+        Returns combined search query -> number of ambiguities it covers, in batch order
+        """
         if not ambiguities:
-            return []
+            return {}
         
         batch_size = max(1, len(ambiguities) // target_batches)
-        batches = []
+        batches = {}
         
         for i in range(0, len(ambiguities), batch_size):
             batch = ambiguities[i:i + batch_size]
             search_queries = [amb.get('search_hint', amb.get('element', '')) for amb in batch]
             combined_query = ' AND '.join(search_queries)
-            batches.append(combined_query)
+            batches[combined_query] = len(batch)
         
         return batches
     
-    def resolve_batch_with_search(self, batch_query: str) -> Optional[str]:
-        """Search the web to clarify a batch of ambiguous elements"""
+    def _resolve_batches(self, runnable: List[str], batches: Dict[str, int], prefetched: Dict[str, Dict[str, Any]]) -> List[Optional[str]]:
+        """Resolve batches on worker threads with the sync client; results are in batch order"""
+        if not runnable:
+            return []
+        with ThreadPoolExecutor(max_workers=min(len(runnable), 4)) as ex:
+            return list(ex.map(
+                lambda b: self.resolve_batch_with_search(b, prefetched.get(b), elements=batches[b]), runnable
+            ))
+    
+    def resolve_batch_with_search(self, batch_query: str, search_results: Optional[Dict[str, Any]] = None, elements: int = 1) -> Optional[str]:
+        """Search the web to clarify a batch of ambiguous elements
+        
+        Pass search_results when the search was already prefetched (and counted).
+        A Serper answer box answers at most one element, so it replaces LLM
+        extraction only for single-element batches; larger batches get it as context.
+        """
         
         # Check cache first
-        if batch_query in self._resolution_cache:
-            return self._resolution_cache[batch_query]
+        with self._cache_lock:
+            if batch_query in self._resolution_cache:
+                return self._get_resolution(batch_query)
         
         try:
-            self.planning_search_calls += 1
-            search_results = self.search_func(batch_query)
+            if search_results is None:
+                self.planning_search_calls += 1
+                search_results = self.search_func(batch_query)
+            
+            answer_box = search_results.get("answer_box")
+            if answer_box and elements == 1:
+                print("📌 Using Serper answer box, skipping LLM extraction")
+                self._cache_resolution(batch_query, answer_box)
+                return answer_box
             
             # Extract relevant information using LLM
-            extraction_prompt = f"""Extract relevant information from these search results to clarify the ambiguous elements.
-
-Batch search query was: "{batch_query}"
-
-Search results:
-{json.dumps(search_results, indent=2)[:2000]}  # Limit to avoid token limits
-
-Provide concise, factual clarifications (1-2 sentences each) that would help someone complete the task:"""
-
-            response = self.llm.invoke(extraction_prompt)
+            extraction_prompt = (
+                _EXTRACTION_PROMPT_HEAD
+                + f'Batch search query was: "{batch_query}"\n\n'
+                + (f"Direct answer: {answer_box}\n\n" if answer_box else "")
+                + f"Search results:\n{_summarize_results(search_results)[:2000]}\n\n"
+                + _EXTRACTION_PROMPT_TAIL
+            )
+
+            response = self._invoke(extraction_prompt)
             resolution = response.content.strip()
             
             # Cache the result
-            self._resolution_cache[batch_query] = resolution
+            self._cache_resolution(batch_query, resolution)
             
             return resolution
             
@@ -302,33 +538,60 @@ Provide concise, factual clarifications (1-2 sentences each) that would help som
             print(f"Warning: Failed to resolve batch '{batch_query[:50]}...': {e}")
             return None
     
-    def _extract_batch_clarifications(self, batch_query: str, resolution: str, clarifications: Dict[str, str]):
+    def _get_resolution(self, key: str) -> str:
+        """Read a cached resolution, marking it most recently used"""
+        with self._cache_lock:
+            self._resolution_cache.move_to_end(key)
+            return self._resolution_cache[key]
+    
+    def _cache_resolution(self, key: str, resolution: str):
+        """Store a resolution and index its key's words for mid-task lookups, evicting the LRU entry when full"""
+        with self._cache_lock:
+            self._resolution_cache[key] = resolution
+            self._resolution_cache.move_to_end(key)
+            for word in _index_words(key):
+                self._word_index[word].add(key)
+            
+            while len(self._resolution_cache) > RESOLUTION_CACHE_MAX:
+                old_key, _ = self._resolution_cache.popitem(last=False)
+                for word in _index_words(old_key):
+                    keys = self._word_index.get(word)
+                    if keys is not None:
+                        keys.discard(old_key)
+                        if not keys:
+                            del self._word_index[word]
+    
+    def _match_resolution(self, question: str) -> Optional[str]:
+        """Return the cached resolution whose key shares the most indexed words with the question
+        
+        A key must share at least two words (or all of its words, if it has
+        fewer) to count, so one incidental word doesn't pull in an unrelated answer.
+        """
+        with self._cache_lock:
+            matches = Counter(k for w in _index_words(question) for k in self._word_index.get(w, ()))
+            for key, shared in matches.most_common():
+                if shared >= min(2, len(_index_words(key))):
+                    return self._get_resolution(key)
+        return None
+    
+    def _extract_batch_clarifications(self, batch_query: str, resolution: str, clarifications: List[str]):
         """Extract individual clarifications from batch resolution"""
-        # For now, use the whole resolution for the batch query
-        # In a more sophisticated version, we could parse individual elements
-        clarifications[batch_query] = resolution
+        # The whole resolution is kept as one line, labelled with the search it answers
+        # so the rewrite model knows which ambiguity it clarifies
+        clarifications.append(f"- {batch_query}: {resolution}")
     
-    def rewrite_query(self, original_query: str, clarifications: Dict[str, str]) -> str:
+    def rewrite_query(self, original_query: str, clarifications: List[str]) -> str:
         """Create a precise, enriched query"""
         
-        prompt = f"""Rewrite this query by incorporating the clarifications while maintaining the original intent.
-
-Original query: "{original_query}"
-
-Clarifications:
-{json.dumps(clarifications, indent=2)}
-
-Rules:
-1. Replace ambiguous elements with specific information
-2. Add helpful context that guides the agent
-3. Keep the same overall structure and intent
-4. Make it more actionable and specific
-5. Don't make it overly long - just more precise
-
-Rewritten query:"""
+        prompt = (
+            _REWRITE_PROMPT_HEAD
+            + f'Original query: "{original_query}"\n\n'
+            + "Clarifications:\n" + "\n".join(clarifications) + "\n\n"
+            + _REWRITE_PROMPT_TAIL
+        )
 
         try:
-            response = self.llm.invoke(prompt)
+            response = self._invoke(prompt)
             enriched_query = response.content.strip()
             
             # Remove any quotes that might wrap the response
@@ -354,10 +617,10 @@ Rewritten query:"""
         print(f"\n🤔 Agent needs clarification: {question}")
         
         # Try to answer from cached information first
-        for cached_element, cached_resolution in self._resolution_cache.items():
-            if any(word in question.lower() for word in cached_element.lower().split()):
-                print(f"📋 Found cached info: {cached_resolution}")
-                return cached_resolution
+        cached_resolution = self._match_resolution(question)
+        if cached_resolution is not None:
+            print(f"📋 Found cached info: {cached_resolution}")
+            return cached_resolution
         
         # Perform new search - it's cheap with Serper!
         try:
@@ -366,21 +629,25 @@ Rewritten query:"""
             
             search_results = self.search_func(question)
             
+            if search_results.get("answer_box"):
+                answer = search_results["answer_box"]
+                self._cache_resolution(question, answer)
+                print(f"🌐 Runtime search answer (answer box): {answer}")
+                return answer
+            
             # Extract answer using LLM
-            answer_prompt = f"""Answer this specific question based on the search results:
-
-Question: "{question}"
-
-Search results:
-{json.dumps(search_results, indent=2)[:1500]}
-
-Provide a direct, helpful answer (1-2 sentences) that would help the Windows automation agent:"""
-
-            response = self.llm.invoke(answer_prompt)
+            answer_prompt = (
+                _ANSWER_PROMPT_HEAD
+                + f'Question: "{question}"\n\n'
+                + f"Search results:\n{_summarize_results(search_results)[:1500]}\n\n"
+                + _ANSWER_PROMPT_TAIL
+            )
+
+            response = self._invoke(answer_prompt)
             answer = response.content.strip()
             
             # Cache for future use
-            self._resolution_cache[question] = answer
+            self._cache_resolution(question, answer)
             
             print(f"🌐 Runtime search answer: {answer}")
             return answer
@@ -394,41 +661,13 @@ class TaskAnalyzer:
     """Generates specific Windows-Use instructions from user queries"""
     
     def __init__(self):
-        # Use Qwen for cheap analysis
-        self.llm = ChatOpenAI(
-            model="qwen/qwen-2.5-72b-instruct",
-            temperature=0.1,
-            max_tokens=500,
-            api_key=os.getenv("OPENROUTER_API_KEY"),
-            base_url="https://openrouter.ai/api/v1",
-            default_headers={
-                "HTTP-Referer": os.getenv("OPENROUTER_HTTP_REFERER", "https://github.com/windows-use"),
-                "X-Title": os.getenv("OPENROUTER_X_TITLE", "Windows-Use Serper Enhanced")
-            }
-        )
+        # Use Qwen for cheap analysis (same client as the translator's default model)
+        self.llm = _get_openrouter_chat("qwen/qwen-2.5-72b-instruct")
     
     def analyze(self, query: str) -> List[str]:
         """Convert user query into specific step-by-step instructions"""
         
-        prompt = f"""You are a Windows automation expert. Convert this request into clear guidance steps.
-
-RULES:
-- Focus on WHAT to do, not HOW to click (the agent knows how to click)
-- Be specific about app names and URLs
-- Include key search terms and button names
-- Maximum 8 high-level steps
-- Each step should guide towards the goal
-
-User request: {query}
-
-Return ONLY a JSON array of guidance steps, like:
-["Open Google Chrome browser",
- "Navigate to bestbuy.com website",
- "Search for wireless gaming headset PS5",
- "Filter by price under $150 and ratings",
- "Select highly rated option and add to cart"]
-
-Steps:"""
+        prompt = f"{_ANALYZE_PROMPT_HEAD}User request: {query}\n\n{_ANALYZE_PROMPT_TAIL}"
 
         response = self.llm.invoke(prompt)
         return self._parse_instructions(response.content)
@@ -442,7 +681,7 @@ Steps:"""
             elif '```' in content:
                 content = content.split('```')[1].split('```')[0]
             
-            instructions = json.loads(content.strip())
+            instructions = _loads(content.strip())
             # Ensure it's a list and cap at 8 instructions
             if isinstance(instructions, list):
                 return instructions[:8]
@@ -456,7 +695,7 @@ Steps:"""
                 line = line.strip()
                 if line and not line.startswith('#'):
                     # Remove quotes and list markers
-                    line = re.sub(r'^["\'\-*\d\.\)]\s*', '', line)
+                    line = _LIST_PREFIX_RE.sub('', line)
                     line = line.strip('"\'')
                     if line:
                         instructions.append(line)
@@ -478,6 +717,9 @@ class SmartWindowsAgent:
         self.task_analyzer = TaskAnalyzer()
         
         # Initialize Windows-Use Enhanced Agent with Gemini
+        from langchain_google_genai import ChatGoogleGenerativeAI
+        from windows_use.agent.enhanced_service import EnhancedAgent
+        
         gemini_llm = ChatGoogleGenerativeAI(
             model='gemini-2.0-flash-thinking-exp',
             temperature=0.2
@@ -488,20 +730,19 @@ class SmartWindowsAgent:
         self.web_translator._web_search_func = self.web_translator.search_func
         self.web_translator.mid_task_callback = self.web_translator.mid_task_clarify
         
-        print(f"🚀 Smart Windows Agent initialized")
-        print(f"   📡 Web Search: Serper (max {max_planning_searches} planning + {max_runtime_searches} runtime)")
-        print(f"   🧠 Translation: {self.web_translator.model_name}")
-        print(f"   🤖 Execution: Gemini Flash Thinking (Enhanced UI)")
-        print(f"   💰 Cost: ~$0.0003 per search (liberal usage enabled!)")
+        sys.stdout.write(
+            "🚀 Smart Windows Agent initialized\n"
+            f"   📡 Web Search: Serper (max {max_planning_searches} planning + {max_runtime_searches} runtime)\n"
+            f"   🧠 Translation: {self.web_translator.model_name}\n"
+            "   🤖 Execution: Gemini Flash Thinking (Enhanced UI)\n"
+            "   💰 Cost: ~$0.0003 per search (liberal usage enabled!)\n"
+        )
     
     def execute(self, user_query: str) -> str:
         """Execute user query with web-enhanced intelligence"""
-        global search_calls
-        initial_search_calls = search_calls
+        initial_search_calls = get_search_calls()
         
-        print(f"\n{'='*60}")
-        print(f"🎯 USER QUERY: {user_query}")
-        print(f"{'='*60}")
+        sys.stdout.write(f"\n{BAR60}\n🎯 USER QUERY: {user_query}\n{BAR60}\n")
         
         try:
             # Step 1: Web-enhanced translation (planning searches only)
@@ -513,16 +754,14 @@ class SmartWindowsAgent:
             instructions = self.task_analyzer.analyze(enhanced_query)
             
             if instructions:
-                print(f"Generated {len(instructions)} guidance steps:")
-                for i, instruction in enumerate(instructions, 1):
-                    print(f"   {i}. {instruction}")
+                listing = "".join(f"   {i}. {instruction}\n" for i, instruction in enumerate(instructions, 1))
+                sys.stdout.write(f"Generated {len(instructions)} guidance steps:\n{listing}")
             else:
                 print("⚠️  No specific instructions generated, using query directly")
                 instructions = [enhanced_query]
             
             # Step 3: Execute with Windows-Use Enhanced Agent
-            print(f"\n🚀 Step 3: Windows-Use Agent Execution")
-            print(f"Enhanced query: {enhanced_query}")
+            sys.stdout.write(f"\n🚀 Step 3: Windows-Use Agent Execution\nEnhanced query: {enhanced_query}\n")
             
             # Create goal-oriented instruction for Windows-Use
             goal_instruction = f"""Complete this task: {enhanced_query}
@@ -543,16 +782,34 @@ Focus on achieving the goal using these guidance points."""
         
         finally:
             # Print cost telemetry
-            final_search_calls = search_calls
+            final_search_calls = get_search_calls()
             actual_searches = final_search_calls - initial_search_calls
             estimated_cost = actual_searches * SERPER_PRICE_PER_QUERY
             
-            print(f"\n💰 Cost Telemetry:")
-            print(f"   serper_planning_calls={self.web_translator.planning_search_calls}/{self.max_planning_searches}")
-            print(f"   serper_runtime_calls={self.web_translator.runtime_search_calls}/{self.max_runtime_searches}")
-            print(f"   total_serper_calls={actual_searches}")
-            print(f"   ~est=${estimated_cost:.4f} (Serper starter pricing)")
-            print(f"   Cache size: {len(self.web_translator._resolution_cache)} items (LRU working)")
+            sys.stdout.write(
+                "\n💰 Cost Telemetry:\n"
+                f"   serper_planning_calls={self.web_translator.planning_search_calls}/{self.max_planning_searches}\n"
+                f"   serper_runtime_calls={self.web_translator.runtime_search_calls}/{self.max_runtime_searches}\n"
+                f"   total_serper_calls={actual_searches}\n"
+                f"   ~est=${estimated_cost:.4f} (Serper starter pricing)\n"
+                f"   Cache size: {len(self.web_translator._resolution_cache)} items (LRU working)\n"
+            )
+
+
+def _enable_input_history(path: str = "~/.windows_use_history") -> None:
+    """Give the task prompt persistent Up-arrow history when readline is available"""
+    try:
+        import readline
+    except ImportError:
+        # Not shipped with CPython on Windows; input() still works without history
+        return
+    histfile = os.path.expanduser(path)
+    try:
+        readline.read_history_file(histfile)
+    except OSError:
+        pass
+    readline.set_history_length(1000)
+    atexit.register(readline.write_history_file, histfile)
 
 
 def main():
@@ -599,15 +856,19 @@ Cost: ~$0.0015 per task (vs ~$0.006 with OpenRouter) - Liberal usage enabled!
     # Resolve Serper API key (prioritize environment variable)
     serper_key = os.getenv("SERPER_API_KEY") or args.serper_key
     if not serper_key:
-        print("❌ Error: Serper API key required")
-        print("   Set SERPER_API_KEY environment variable or use --serper-key YOUR_KEY")
-        print("   Sign up at https://serper.dev/ (first 2,500 searches free)")
+        sys.stdout.write(
+            "❌ Error: Serper API key required\n"
+            "   Set SERPER_API_KEY environment variable or use --serper-key YOUR_KEY\n"
+            "   Sign up at https://serper.dev/ (first 2,500 searches free)\n"
+        )
         return
     
     # Verify required environment variables
     if not os.getenv("OPENROUTER_API_KEY"):
-        print("❌ Error: OPENROUTER_API_KEY required for analysis models")
-        print("   Set OPENROUTER_API_KEY environment variable")
+        sys.stdout.write(
+            "❌ Error: OPENROUTER_API_KEY required for analysis models\n"
+            "   Set OPENROUTER_API_KEY environment variable\n"
+        )
         return
     
     # Initialize the agent
@@ -617,17 +878,33 @@ Cost: ~$0.0015 per task (vs ~$0.006 with OpenRouter) - Liberal usage enabled!
         print(f"❌ Failed to initialize agent: {e}")
         return
     
-    print(f"\n🌟 Serper-Enhanced Smart Windows Agent Ready (Liberal Mode!)")
-    print(f"   💰 Cost: ~60x cheaper than OpenRouter (~$0.0015 vs ~$0.006 per task)")
-    print(f"   📋 Planning searches: up to {args.max_planning_searches} per task")
-    print(f"   🔄 Runtime searches: up to {args.max_runtime_searches} per task (enabled!)")
-    print(f"   💾 LRU caching: 64 entries for repeated queries")
-    print(f"   🚀 Mid-task clarification: fully enabled (it's cheap!)")
+    sys.stdout.write(
+        "\n🌟 Serper-Enhanced Smart Windows Agent Ready (Liberal Mode!)\n"
+        "   💰 Cost: ~60x cheaper than OpenRouter (~$0.0015 vs ~$0.006 per task)\n"
+        f"   📋 Planning searches: up to {args.max_planning_searches} per task\n"
+        f"   🔄 Runtime searches: up to {args.max_runtime_searches} per task (enabled!)\n"
+        "   💾 LRU caching: 256 entries for repeated queries, backed by a 24h disk cache\n"
+        "   🚀 Mid-task clarification: fully enabled (it's cheap!)\n"
+    )
+    
+    # Batch mode: tasks piped on stdin (one per line) run back to back without prompting.
+    # Tasks stay sequential because they all drive the same desktop.
+    if not sys.stdin.isatty():
+        queries = [line.strip() for line in sys.stdin if line.strip()]
+        for user_query in queries:
+            if user_query.lower() in ['quit', 'exit', 'q']:
+                break
+            try:
+                agent.execute(user_query)
+            except Exception as e:
+                print(f"❌ Unexpected error: {e}")
+        return
     
     # Interactive loop
+    _enable_input_history()
     while True:
         try:
-            print(f"\n{'='*60}")
+            print(f"\n{BAR60}")
             user_query = input("Enter your task (or 'quit' to exit): ").strip()
             
             if not user_query or user_query.lower() in ['quit', 'exit', 'q']:
@@ -1,35 +1,38 @@
-import json
+import asyncio
+import logging
 import os
-from typing import List
-from langchain_openai import ChatOpenAI
-from langchain_google_genai import ChatGoogleGenerativeAI
-from windows_use.agent import Agent
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import TYPE_CHECKING, Any, Callable, List, Optional
 from dotenv import load_dotenv
+from json_array import ArrayScanner, extract_json_array
+from llm_cache import LLMCache, MAX_CACHEABLE_TEMPERATURE, cache_key
+
+# langchain and the agent stack are imported where first needed, keeping the
+# parsing helpers importable without them
+if TYPE_CHECKING:
+    from windows_use.agent import Agent
 
 load_dotenv()
 
-class TaskAnalyzer:
-    """Generates specific Windows-Use instructions from user queries"""
-    
-    def __init__(self):
-        # Use Qwen for cheap analysis
-        self.llm = ChatOpenAI(
-            model="qwen/qwen-2.5-72b-instruct",
-            temperature=0.1,
-            max_tokens=500,
-            api_key=os.getenv("OPENROUTER_API_KEY"),
-            base_url="https://openrouter.ai/api/v1",
-            default_headers={
-                "HTTP-Referer": os.getenv("OPENROUTER_HTTP_REFERER", "https://github.com/windows-use"),
-                "X-Title": os.getenv("OPENROUTER_X_TITLE", "Windows-Use Enhanced")
-            }
-        )
-    
-    def analyze(self, query: str) -> List[str]:
-        """Convert user query into specific step-by-step instructions"""
-        
-        # Simplified prompt that focuses on HIGH-LEVEL guidance
-        prompt = f"""You are a Windows automation expert. Convert this request into clear guidance steps.
+# Same plain-message console logger as the windows_use agent, so task status
+# and agent step logs share one stream and stay in order
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+handler = logging.StreamHandler()
+formatter = logging.Formatter('%(message)s')
+handler.setFormatter(formatter)
+logger.addHandler(handler)
+
+try:  # optional faster JSON decoder; falls back to the stdlib
+    from orjson import loads as _loads
+except ImportError:
+    from json import loads as _loads
+
+ANALYZE_MEMO_MAX = 256
+
+# Static analyzer prompt around the user request
+_ANALYZER_PREFIX = """You are a Windows automation expert. Convert this request into clear guidance steps.
 
 RULES:
 - Focus on WHAT to do, not HOW to click (the agent knows how to click)
@@ -38,7 +41,8 @@ RULES:
 - Maximum 8 high-level steps
 - Each step should guide towards the goal
 
-User request: {query}
+User request: """
+_ANALYZER_SUFFIX = """
 
 Return ONLY a JSON array of guidance steps, like:
 ["Open Google Chrome browser",
@@ -47,26 +51,182 @@ Return ONLY a JSON array of guidance steps, like:
  "Select a cheap option and add to cart"]
 
 Steps:"""
+_BATCH_ANALYZER_PREFIX = _ANALYZER_PREFIX.replace("User request: ", "User requests:\n")
+_BATCH_ANALYZER_SUFFIX = """
+
+Return ONLY a JSON array where element i is the JSON array of guidance steps for request i, like:
+[["Open Google Chrome browser", "Navigate to lowes.com website"],
+ ["Open Notepad", "Type the note"]]
+
+Steps:"""
+
+def _load_json_array(content: str) -> Optional[list]:
+    """Decode the first JSON array in a response; None if it has no valid one"""
+    try:
+        value = _loads(extract_json_array(content))
+    except Exception:
+        return None
+    return value if isinstance(value, list) else None
 
-        response = self.llm.invoke(prompt)
-        return self._parse_instructions(response.content)
+def _as_steps(value: Any) -> Optional[List[str]]:
+    """Non-empty string steps from a decoded step list, capped at 8; None if it isn't a list"""
+    if not isinstance(value, list):
+        return None
+    return [step.strip() for step in value if isinstance(step, str) and step.strip()][:8]
+
+def _parse_batch(content: str, count: int) -> Optional[List[List[str]]]:
+    """Steps per request from a batch response; None unless all `count` step lists are usable"""
+    batches = _load_json_array(content)
+    if batches is None or len(batches) != count:
+        return None
+    steps = [_as_steps(b) for b in batches]
+    return steps if all(steps) else None
+
+def _has_steps(content: str) -> bool:
+    """True when a response decodes to a non-empty list of string steps, i.e. is worth caching"""
+    return bool(_as_steps(_load_json_array(content)))
+
+class TaskAnalyzer:
+    """Generates specific Windows-Use instructions from user queries"""
+    
+    def __init__(self):
+        from langchain_openai import ChatOpenAI
+        
+        # Use Qwen for cheap analysis
+        self.model = "qwen/qwen-2.5-72b-instruct"
+        self.temperature = 0.1
+        self.max_tokens = 500
+        self.llm = ChatOpenAI(
+            model=self.model,
+            temperature=self.temperature,
+            max_tokens=self.max_tokens,
+            api_key=os.getenv("OPENROUTER_API_KEY"),
+            base_url="https://openrouter.ai/api/v1",
+            default_headers={
+                "HTTP-Referer": os.getenv("OPENROUTER_HTTP_REFERER", "https://github.com/windows-use"),
+                "X-Title": os.getenv("OPENROUTER_X_TITLE", "Windows-Use Enhanced")
+            }
+        )
+        # Repeat prompts are answered from disk; only safe for near-deterministic sampling
+        self.cache = LLMCache() if self.temperature <= MAX_CACHEABLE_TEMPERATURE else None
+        # In-process memo of parsed steps, keyed by whitespace-normalized query
+        self._memo: "OrderedDict[str, List[str]]" = OrderedDict()
+    
+    def analyze(self, query: str) -> List[str]:
+        """Convert user query into specific step-by-step instructions"""
+        key = " ".join(query.split())
+        if key in self._memo:
+            return self._memo_get(key)
+        return self._memo_set(key, self._parse_instructions(self._cached_invoke(self._build_prompt(query), _has_steps)))
+    
+    async def aanalyze(self, query: str) -> List[str]:
+        """Async analyze; lets callers gather several analyses concurrently"""
+        key = " ".join(query.split())
+        if key in self._memo:
+            return self._memo_get(key)
+        return self._memo_set(key, self._parse_instructions(await self._acached_invoke(self._build_prompt(query), _has_steps)))
+    
+    def _memo_get(self, key: str) -> List[str]:
+        self._memo.move_to_end(key)
+        return list(self._memo[key])
+    
+    def _memo_set(self, key: str, instructions: List[str]) -> List[str]:
+        if instructions:  # a failed analysis should be retried, not remembered
+            self._memo[key] = list(instructions)
+            if len(self._memo) > ANALYZE_MEMO_MAX:
+                self._memo.popitem(last=False)
+        return instructions
+    
+    def analyze_batch(self, queries: List[str]) -> List[List[str]]:
+        """Analyze several queries with one LLM call; element i holds the steps for queries[i]
+        
+        Memoized queries are answered without the LLM, and the batch results fill the memo.
+        """
+        keys = [" ".join(q.split()) for q in queries]
+        results = {key: self._memo_get(key) for key in keys if key in self._memo}
+        missing = [key for key in dict.fromkeys(keys) if key not in results]
+        
+        if len(missing) == 1:
+            results[missing[0]] = self.analyze(missing[0])
+        elif missing:
+            numbered = "\n".join(f"{i}) {q}" for i, q in enumerate(missing, 1))
+            prompt = _BATCH_ANALYZER_PREFIX + numbered + _BATCH_ANALYZER_SUFFIX
+            content = self._cached_invoke(
+                prompt, lambda c: _parse_batch(c, len(missing)) is not None, max_tokens=self.max_tokens * len(missing)
+            )
+            batches = _parse_batch(content, len(missing))
+            if batches is None:
+                logger.warning("Unusable batch response, analyzing each request separately")
+                # One call per query on worker threads; works whether or not the caller runs an event loop
+                with ThreadPoolExecutor(max_workers=min(len(missing), 4)) as executor:
+                    batches = list(executor.map(self.analyze, missing))
+            else:
+                batches = [self._memo_set(key, steps) for key, steps in zip(missing, batches)]
+            results.update(zip(missing, batches))
+        return [list(results[key]) for key in keys]
+    
+    async def aanalyze_many(self, queries: List[str]) -> List[List[str]]:
+        """Analyze independent queries concurrently; results are in query order"""
+        return await asyncio.gather(*(self.aanalyze(q) for q in queries))
+    
+    def _cached_invoke(self, prompt: str, accept: Callable[[str], bool], max_tokens: Optional[int] = None) -> str:
+        """Return the response text for `prompt`, calling the LLM only on a cache miss
+        
+        A fresh response is stored only if `accept` passes it, so a malformed or
+        truncated reply is retried on the next call instead of replayed from disk.
+        """
+        key = cache_key(self.model, prompt, self.temperature)
+        if self.cache is not None:
+            cached = self.cache.get(key)
+            if cached is not None:
+                return cached
+        kwargs = {"max_tokens": max_tokens} if max_tokens else {}
+        content = self._stream_json_array(prompt, **kwargs)
+        if self.cache is not None and accept(content):
+            self.cache.set(key, content)
+        return content
+    
+    def _stream_json_array(self, prompt: str, **kwargs) -> str:
+        """Stream the response and stop reading once the top-level JSON array closes"""
+        parts = []
+        scanner = ArrayScanner()
+        stream = self.llm.stream(prompt, **kwargs)
+        try:
+            for chunk in stream:
+                end = scanner.feed(chunk.content)
+                if end is not None:
+                    # Anything after the array would be discarded by the parser anyway
+                    parts.append(chunk.content[:end])
+                    break
+                parts.append(chunk.content)
+        finally:
+            stream.close()
+        return "".join(parts)
+    
+    async def _acached_invoke(self, prompt: str, accept: Callable[[str], bool]) -> str:
+        key = cache_key(self.model, prompt, self.temperature)
+        if self.cache is not None:
+            cached = self.cache.get(key)
+            if cached is not None:
+                return cached
+        content = (await self.llm.ainvoke(prompt)).content
+        if self.cache is not None and accept(content):
+            self.cache.set(key, content)
+        return content
+    
+    def _build_prompt(self, query: str) -> str:
+        # Simplified prompt that focuses on HIGH-LEVEL guidance; the static text is
+        # shared across calls so providers can reuse the cached prefix
+        return _ANALYZER_PREFIX + query + _ANALYZER_SUFFIX
     
     def _parse_instructions(self, content: str) -> List[str]:
         """Extract instructions from LLM response"""
         try:
-            # Clean up response
-            if '```json' in content:
-                content = content.split('```json')[1].split('```')[0]
-            elif '```' in content:
-                content = content.split('```')[1].split('```')[0]
-            
-            instructions = json.loads(content.strip())
-            # Ensure it's a list and cap at 8 instructions
-            if isinstance(instructions, list):
-                return instructions[:8]
-            return []
+            instructions = _loads(extract_json_array(content))
+            # Ensure it's a list of strings and cap at 8 instructions
+            return _as_steps(instructions) or []
         except Exception as e:
-            print(f"Warning: Failed to parse JSON: {e}")
+            logger.warning("Failed to parse JSON: %s", e)
             # Try basic line splitting as fallback
             lines = content.strip().split('\n')
             return [line.strip('- •123456789.[] "\'') for line in lines if line.strip()][:8]
@@ -75,61 +235,79 @@ class SmartWindowsAgent:
     """Enhanced Windows agent with instruction generation"""
     
     def __init__(self):
+        from langchain_google_genai import ChatGoogleGenerativeAI
+        
         self.analyzer = TaskAnalyzer()
         # Use cheapest model for execution
         self.executor_llm = ChatGoogleGenerativeAI(
             model='gemini-2.5-flash-lite',
             temperature=0.0
         )
+        # Built on first execute and reused for later tasks
+        self._agent = None
+    
+    def _get_agent(self, instructions: List[str]) -> 'Agent':
+        """Return the executor agent, built on first use; per-task state lives in invoke()"""
+        if self._agent is None:
+            from windows_use.agent import Agent
+            
+            self._agent = Agent(
+                llm=self.executor_llm,
+                instructions=instructions,  # Pass our generated instructions
+                browser='chrome',
+                use_vision=False,  # Keep vision off for cost
+                max_steps=30
+            )
+        else:
+            # Instructions are read when each step's system prompt is built
+            self._agent.instructions = instructions
+        return self._agent
     
     def execute(self, query: str) -> str:
         """Execute task with generated instructions"""
         
-        print("="*60)
-        print(f"TASK: {query}")
-        print("="*60)
+        # Each status block is one log record rather than a write per line
+        logger.info("%s\nTASK: %s\n%s", "="*60, query, "="*60)
         
         # Generate instructions
-        print("\n🔍 Analyzing task...")
+        logger.info("\n🔍 Analyzing task...")
         instructions = self.analyzer.analyze(query)
         
         if not instructions:
-            print("❌ Failed to understand task")
+            logger.error("❌ Failed to understand task")
             return "Failed to understand task"
         
-        print(f"\n📋 Generated {len(instructions)} instructions:")
-        for i, inst in enumerate(instructions, 1):
-            print(f"   {i}. {inst}")
+        logger.info(
+            "\n📋 Generated %d instructions:\n%s",
+            len(instructions),
+            "\n".join(f"   {i}. {inst}" for i, inst in enumerate(instructions, 1)),
+        )
         
         # Execute with Windows-Use
-        print(f"\n🤖 Executing with Windows-Use agent...")
-        print(f"   Model: gemini-2.5-flash-lite")
-        print(f"   Vision: False")
-        print(f"   Max steps: 30")
-        print("\n" + "-"*60)
+        logger.info(
+            "\n🤖 Executing with Windows-Use agent...\n"
+            "   Model: gemini-2.5-flash-lite\n"
+            "   Vision: False\n"
+            "   Max steps: 30\n"
+            "\n%s", "-"*60
+        )
         
         try:
-            agent = Agent(
-                llm=self.executor_llm,
-                instructions=instructions,  # Pass our generated instructions
-                browser='chrome',
-                use_vision=False,  # Keep vision off for cost
-                max_steps=30
-            )
+            agent = self._get_agent(instructions)
             
             result = agent.invoke(query)
             
-            print("-"*60)
+            logger.info("-"*60)
             
             if result.error:
-                print(f"\n❌ Execution error: {result.error}")
+                logger.error("\n❌ Execution error: %s", result.error)
                 return f"Error: {result.error}"
             
-            print(f"\n✅ Task completed")
+            logger.info("\n✅ Task completed")
             return result.content or "Task completed successfully"
             
         except Exception as e:
-            print(f"\n❌ Unexpected error: {str(e)}")
+            logger.error("\n❌ Unexpected error: %s", e)
             return f"Error: {str(e)}"
 
 def main():
@@ -15,22 +15,161 @@ Current Status: PRODUCTION READY 🚀
 Last Updated: 2025-01-27
 """
 
+import atexit
 import json
 import os
 import re
-from typing import List, Dict, Any, Optional, Callable
-from langchain_openai import ChatOpenAI
-from langchain_google_genai import ChatGoogleGenerativeAI
-from windows_use.agent.enhanced_service import EnhancedAgent
+import sys
+import threading
+import time
+from collections import Counter, defaultdict
+from concurrent.futures import Future, ThreadPoolExecutor
+from functools import lru_cache
+from pathlib import Path
+from typing import List, Dict, Any, Optional, Callable, Tuple, Union
 from dotenv import load_dotenv
-from web_search import create_web_search_function
+from pydantic import BaseModel, Field
+from llm_cache import LLMCache, MAX_CACHEABLE_TEMPERATURE, cache_key
 
 load_dotenv()
 
+# Console banners; each banner block is emitted with a single write
+BAR80 = "=" * 80
+RULE80 = "-" * 80
+
+# Mid-task clarification answers persisted between runs (same TTL as the web search cache)
+CLARIFY_CACHE_PATH = Path(".cache/clarify.json")
+CLARIFY_CACHE_TTL_S = 1800
+
+def _load_clarify_cache() -> Dict[str, Dict[str, Any]]:
+    """Load unexpired clarification answers from disk"""
+    try:
+        entries = json.loads(CLARIFY_CACHE_PATH.read_text(encoding="utf-8"))
+    except Exception:
+        return {}
+    now = time.time()
+    return {k: v for k, v in entries.items() if now - v.get("ts", 0) <= CLARIFY_CACHE_TTL_S}
+
+# One in-memory copy per process, shared by every translator and saved once at exit
+_clarify_cache: Optional[Dict[str, Dict[str, Any]]] = None
+_clarify_cache_lock = threading.Lock()
+
+def _get_clarify_cache() -> Dict[str, Dict[str, Any]]:
+    """Shared clarification answers keyed by normalized question text, loaded on first use"""
+    global _clarify_cache
+    with _clarify_cache_lock:
+        if _clarify_cache is None:
+            _clarify_cache = _load_clarify_cache()
+        return _clarify_cache
+
+@atexit.register
+def _save_clarify_cache():
+    """Persist clarification answers so re-runs skip the search and LLM round-trip
+    
+    Entries are merged into what is on disk, keeping the newer answer per
+    question, so answers saved by another process in the meantime survive.
+    """
+    if not _clarify_cache:
+        return
+    try:
+        entries = _load_clarify_cache()
+        for key, entry in list(_clarify_cache.items()):
+            if entry.get("ts", 0) >= entries.get(key, {}).get("ts", 0):
+                entries[key] = entry
+        CLARIFY_CACHE_PATH.parent.mkdir(parents=True, exist_ok=True)
+        CLARIFY_CACHE_PATH.write_text(json.dumps(entries, ensure_ascii=False), encoding="utf-8")
+    except Exception as e:
+        print(f"Warning: Failed to save clarification cache: {e}")
+
+# Local vocabulary for the common ambiguity types; one alternation so a query is scanned once.
+# Queries with none of these words (e.g. "open calculator") skip the LLM ambiguity check.
+_AMBIG_PAT = re.compile(
+    r"(?P<SUBJECTIVE>\b(?:cheap(?:est)?|affordable|budget|best|good|nice|popular)\b)"
+    r"|(?P<LOCATION>\b(?:near|nearby|nearest|local|closest|downtown)\b)"
+    r"|(?P<TIME_DEPENDENT>\b(?:current|latest|today|tonight|this week)\b)"
+    r"|(?P<BUSINESS>\b(?:store|shop|restaurant|hours|open now|address|phone|price|prices|buy|order|cart)\b)",
+    re.I,
+)
+
+# Structured-output schemas; models that can't produce them fall back to parsing the text reply
+class Ambiguity(BaseModel):
+    type: str = Field(..., description="LOCATION, SUBJECTIVE, PRODUCT, TIME_DEPENDENT or BUSINESS")
+    element: str = Field(..., description="the ambiguous words exactly as they appear in the query")
+    search_hint: str = Field(..., description="a web search query that would clarify the element")
+
+class AmbiguityAnalysis(BaseModel):
+    ambiguities: List[Ambiguity] = Field(default_factory=list, description="ambiguous elements, empty if the query is clear")
+    query_template: str = Field("", description="the query rewritten as an actionable instruction with [[n]] in place of the n-th ambiguous element")
+
+class Instructions(BaseModel):
+    steps: List[str] = Field(..., description="at most 8 high-level guidance steps")
+
+# Models that rejected or ignored a structured request; they get the plain prompt from then on
+_NO_STRUCTURED_OUTPUT: set = set()
+
+def _structured_invoke(llm, schema, prompt: str) -> Union[BaseModel, str]:
+    """Invoke `llm` bound to `schema`, returning the parsed model or, failing that, the reply text
+    
+    Each prompt is sent once: a reply that doesn't parse into `schema` comes back
+    as text for the caller's JSON parser. Whether a model supports structured
+    output is learned on its first call and remembered for the process.
+    """
+    model = getattr(llm, "model_name", None)
+    if model not in _NO_STRUCTURED_OUTPUT:
+        try:
+            result = llm.with_structured_output(schema, include_raw=True).invoke(prompt)
+        except Exception as e:
+            # Rate limits, timeouts etc. say nothing about support; let the caller handle them
+            if not isinstance(e, NotImplementedError) and getattr(e, "status_code", None) not in (400, 404, 422):
+                raise
+            print(f"⚠️  {model} can't return structured output ({e}), using the text prompt from now on")
+            _NO_STRUCTURED_OUTPUT.add(model)
+        else:
+            if result["parsed"] is not None:
+                return result["parsed"]
+            raw = result["raw"]
+            # Neither a tool call nor a JSON body means the schema was ignored. A parsing
+            # error on structured content is a one-off bad reply, not missing support
+            if not getattr(raw, "tool_calls", None) and not str(raw.content).lstrip().startswith("{"):
+                _NO_STRUCTURED_OUTPUT.add(model)
+            return raw.content
+    return llm.invoke(prompt).content
+
+# Word tokens used to match mid-task questions against resolved elements
+_TOKEN_PAT = re.compile(r"\w+")
+
+# Query template placeholders returned with the ambiguity analysis
+_PLACEHOLDER_PAT = re.compile(r"\[\[\d+\]\]")
+
+@lru_cache(maxsize=None)
+def _get_executor_llm(model: str = 'gemini-2.5-flash-lite', temperature: float = 0.0):
+    """Shared Gemini client so every agent in the process reuses one connection and auth token"""
+    from langchain_google_genai import ChatGoogleGenerativeAI
+    
+    return ChatGoogleGenerativeAI(model=model, temperature=temperature)
+
+@lru_cache(maxsize=None)
+def _make_openrouter_llm(model: str, temperature: float = 0.1, max_tokens: int = 800, title: str = "Windows-Use Web Enhanced"):
+    """Shared OpenRouter client per configuration; one place for the key, base URL and attribution headers"""
+    from langchain_openai import ChatOpenAI
+    
+    return ChatOpenAI(
+        model=model,
+        temperature=temperature,
+        max_tokens=max_tokens,
+        api_key=os.getenv("OPENROUTER_API_KEY"),
+        base_url="https://openrouter.ai/api/v1",
+        default_headers={
+            "HTTP-Referer": os.getenv("OPENROUTER_HTTP_REFERER", "https://github.com/windows-use"),
+            "X-Title": os.getenv("OPENROUTER_X_TITLE", title)
+        }
+    )
+
+
 class WebEnhancedTranslator:
     """Web-enhanced translation layer that resolves query ambiguities before execution"""
     
-    def __init__(self, model_name=None):
+    def __init__(self, model_name=None, llm=None):
         # Use GPT-4 Mini Search Preview for web-enhanced analysis (cost-effective, has :online capability)
         # This model can handle both translation and web search in one place
         
@@ -39,13 +178,20 @@ class WebEnhancedTranslator:
             model_name = "openai/gpt-4o-mini-search-preview:online"
         
         self.model_name = model_name
-        self.llm = self._initialize_llm(model_name)
+        self.llm = llm if llm is not None else self._initialize_llm(model_name)
         
         # Callback for mid-task clarification (set by parent agent)
         self.mid_task_callback: Optional[Callable[[str], str]] = None
         
         # Cache for resolved information to avoid duplicate searches
         self._resolution_cache: Dict[str, str] = {}
+        # token -> elements containing it, for matching mid-task questions
+        self._token_index: Dict[str, set] = defaultdict(set)
+        # Resolutions are cached from worker threads
+        self._cache_lock = threading.Lock()
+        
+        # Answers to mid-task questions keyed by normalized question text (process-wide)
+        self._clarify_cache = _get_clarify_cache()
     
     def _initialize_llm(self, preferred_model: str):
         """Initialize LLM with GPT-4 Mini Search Preview as primary model"""
@@ -68,17 +214,7 @@ class WebEnhancedTranslator:
         for model in unique_models:
             try:
                 print(f"🤖 Trying model: {model}")
-                llm = ChatOpenAI(
-                    model=model,
-                    temperature=0.1,
-                    max_tokens=800,
-                    api_key=os.getenv("OPENROUTER_API_KEY"),
-                    base_url="https://openrouter.ai/api/v1",
-                    default_headers={
-                        "HTTP-Referer": os.getenv("OPENROUTER_HTTP_REFERER", "https://github.com/windows-use"),
-                        "X-Title": os.getenv("OPENROUTER_X_TITLE", "Windows-Use Web Enhanced")
-                    }
-                )
+                llm = _make_openrouter_llm(model)
                 
                 # Test the model with a simple query
                 test_response = llm.invoke("Test")
@@ -97,8 +233,9 @@ class WebEnhancedTranslator:
         """Main translation method that enriches the query"""
         print("🌐 Analyzing query for ambiguities...")
         
-        # Step 1: Identify ambiguous elements
-        ambiguities = self.identify_ambiguities(query)
+        # Step 1: Identify ambiguous elements; the same call returns a query template
+        # so the final rewrite usually needs no second LLM round-trip
+        ambiguities, template = self.analyze_query(query)
         
         if not ambiguities:
             print("✅ No ambiguities found, query is clear")
@@ -108,18 +245,25 @@ class WebEnhancedTranslator:
         for ambiguity in ambiguities:
             print(f"   • {ambiguity['type']}: {ambiguity['element']}")
         
-        # Step 2: Resolve ambiguities with web search
-        clarifications = {}
-        for ambiguity in ambiguities:
+        # Step 2: Resolve ambiguities with web search; each lookup is an independent
+        # search + LLM round-trip, so they run side by side on worker threads with the
+        # sync client (results kept in order). Repeated elements share one lookup.
+        unique = list({a.get('element', ''): a for a in ambiguities}.values())
+        for ambiguity in unique:
             print(f"\n🔎 Resolving '{ambiguity['element']}'...")
-            resolution = self.resolve_with_search(ambiguity)
+        with ThreadPoolExecutor(max_workers=min(len(unique), 4)) as executor:
+            resolutions = list(executor.map(self.resolve_with_search, unique))
+        clarifications = {}
+        for ambiguity, resolution in zip(unique, resolutions):
             if resolution:
                 clarifications[ambiguity['element']] = resolution
                 print(f"✅ Resolved: {resolution[:100]}...")
         
         # Step 3: Rewrite the query with clarifications
         if clarifications:
-            enriched_query = self.rewrite_query(query, clarifications)
+            enriched_query = self._fill_template(template, ambiguities, clarifications)
+            if enriched_query is None:
+                enriched_query = self.rewrite_query(query, clarifications)
             print(f"\n📝 Enriched query:")
             print(f"   Original: {query}")
             print(f"   Enhanced: {enriched_query}")
@@ -129,8 +273,28 @@ class WebEnhancedTranslator:
     
     def identify_ambiguities(self, query: str) -> List[Dict[str, str]]:
         """Detect elements in the query that need clarification"""
-        
-        prompt = f"""Analyze this user query and identify ambiguous elements that would benefit from web search clarification.
+        return self.analyze_query(query)[0]
+    
+    def analyze_query(self, query: str) -> Tuple[List[Dict[str, str]], Optional[str]]:
+        """Detect ambiguities and get a query template with a [[n]] placeholder per ambiguity
+        
+        The template is None when the model didn't supply one (or the heuristic
+        fallback was used); callers then rewrite with rewrite_query.
+        """
+        if not _AMBIG_PAT.search(query):
+            return [], None
+        try:
+            analysis = _structured_invoke(self.llm, AmbiguityAnalysis, self._ambiguity_prompt(query))
+            if isinstance(analysis, str):
+                return self._parse_analysis(analysis)
+            return [a.model_dump() for a in analysis.ambiguities], analysis.query_template.strip() or None
+        except Exception as e:
+            print(f"Warning: Failed to identify ambiguities: {e}")
+            return self._heuristic_ambiguities(query), None
+    
+    def _ambiguity_prompt(self, query: str) -> str:
+        """Build the ambiguity detection prompt for a query"""
+        return f"""Analyze this user query and identify ambiguous elements that would benefit from web search clarification.
 
 Query: "{query}"
 
@@ -141,69 +305,90 @@ Look for these types of ambiguities:
 4. TIME_DEPENDENT - information that changes over time (e.g., "current prices", "latest")
 5. BUSINESS - store hours, specific locations, contact info needs
 
-IMPORTANT: You must respond with ONLY a valid JSON array, nothing else. No explanations, no markdown formatting.
+IMPORTANT: You must respond with ONLY a valid JSON object, nothing else. No explanations, no markdown formatting.
+The object has two keys:
+- "ambiguities": the list of ambiguous elements
+- "query_template": the query rewritten as a precise, actionable instruction (same intent, not overly long) in which the n-th ambiguous element is replaced by the placeholder [[n]], counting from 1
 
 Example responses:
-[{{"type": "LOCATION", "element": "near Bashford Manor", "search_hint": "Lowe's store locations near Bashford Manor"}}, {{"type": "SUBJECTIVE", "element": "cheap", "search_hint": "affordable screwdriver prices at Lowe's"}}]
+{{"ambiguities": [{{"type": "LOCATION", "element": "near Bashford Manor", "search_hint": "Lowe's store locations near Bashford Manor"}}, {{"type": "SUBJECTIVE", "element": "cheap", "search_hint": "affordable screwdriver prices at Lowe's"}}], "query_template": "Buy a [[2]] screwdriver at the Lowe's [[1]]"}}
 
 OR if no ambiguities:
-[]
+{{"ambiguities": [], "query_template": ""}}
 
 Response (JSON only):"""
-
-        try:
-            response = self.llm.invoke(prompt)
-            content = response.content.strip()
-            
-            # Clean up response
-            if '```json' in content:
-                content = content.split('```json')[1].split('```')[0]
-            elif '```' in content:
-                content = content.split('```')[1].split('```')[0]
-            
-            ambiguities = json.loads(content)
-            return ambiguities if isinstance(ambiguities, list) else []
-            
-        except Exception as e:
-            print(f"Warning: Failed to identify ambiguities: {e}")
-            return []
+    
+    def _parse_analysis(self, content: str) -> Tuple[List[Dict[str, str]], Optional[str]]:
+        """Parse the ambiguity detection response into (ambiguities, query_template)"""
+        content = content.strip()
+        
+        # Clean up response
+        if '```json' in content:
+            content = content.split('```json')[1].split('```')[0]
+        elif '```' in content:
+            content = content.split('```')[1].split('```')[0]
+        
+        parsed = json.loads(content)
+        if isinstance(parsed, list):  # bare ambiguity array, no template
+            return parsed, None
+        if not isinstance(parsed, dict):
+            return [], None
+        ambiguities = parsed.get("ambiguities")
+        template = parsed.get("query_template")
+        return (
+            ambiguities if isinstance(ambiguities, list) else [],
+            template.strip() if isinstance(template, str) and template.strip() else None,
+        )
+    
+    @staticmethod
+    def _fill_template(template: Optional[str], ambiguities: List[Dict[str, str]], clarifications: Dict[str, str]) -> Optional[str]:
+        """Substitute resolved clarifications into the query template
+        
+        Returns None when the template is missing or doesn't carry exactly the
+        expected placeholders, so the caller can fall back to rewrite_query.
+        """
+        if not template:
+            return None
+        filled = template
+        for n, ambiguity in enumerate(ambiguities, 1):
+            placeholder = f"[[{n}]]"
+            if placeholder not in filled:
+                return None
+            element = ambiguity.get('element', '')
+            resolution = clarifications.get(element)
+            filled = filled.replace(placeholder, f"{element} ({resolution})" if resolution else element)
+        if _PLACEHOLDER_PAT.search(filled):
+            return None
+        return filled
+    
+    def _heuristic_ambiguities(self, query: str) -> List[Dict[str, str]]:
+        """Keyword-based ambiguity detection used when the LLM response is unusable"""
+        ambiguities = []
+        seen = set()
+        for match in _AMBIG_PAT.finditer(query):
+            element = match.group(0).lower()
+            if element in seen:
+                continue
+            seen.add(element)
+            ambiguities.append({'type': match.lastgroup, 'element': element, 'search_hint': query})
+        return ambiguities
     
     def resolve_with_search(self, ambiguity: Dict[str, str]) -> Optional[str]:
         """Search the web to clarify ambiguous elements"""
         
         element = ambiguity.get('element', '')
-        search_hint = ambiguity.get('search_hint', element)
         
         # Check cache first
         if element in self._resolution_cache:
             return self._resolution_cache[element]
         
         try:
-            # Use the web_search function that's available in the environment
-            # This will be dynamically injected by the parent process
-            if hasattr(self, '_web_search_func'):
-                search_results = self._web_search_func(search_hint)
-            else:
-                # Fallback for testing
-                search_results = f"Mock search results for: {search_hint}"
-            
-            # Extract relevant information using LLM
-            extraction_prompt = f"""Extract relevant information from these search results to clarify the ambiguous element.
-
-Ambiguous element: "{element}"
-Type: {ambiguity.get('type', 'UNKNOWN')}
-Search query was: "{search_hint}"
-
-Search results:
-{str(search_results)[:2000]}  # Limit to avoid token limits
-
-Provide a concise, factual clarification (1-2 sentences max) that would help someone complete the task:"""
-
-            response = self.llm.invoke(extraction_prompt)
+            search_results = self._search(ambiguity.get('search_hint', element))
+            response = self.llm.invoke(self._extraction_prompt(ambiguity, search_results))
             resolution = response.content.strip()
             
             # Cache the result
-            self._resolution_cache[element] = resolution
+            self._cache_resolution(element, resolution)
             
             return resolution
             
@@ -211,6 +396,49 @@ Provide a concise, factual clarification (1-2 sentences max) that would help som
             print(f"Warning: Failed to resolve '{element}': {e}")
             return None
     
+    def _cache_resolution(self, element: str, resolution: str):
+        """Store a resolution and index the element's tokens"""
+        with self._cache_lock:
+            self._resolution_cache[element] = resolution
+            for token in _TOKEN_PAT.findall(element.lower()):
+                self._token_index[token].add(element)
+    
+    def _match_resolution(self, question: str) -> Optional[str]:
+        """Return the cached resolution whose element shares the most tokens with the question
+        
+        An element must share at least two tokens (or all of its tokens, if it has
+        fewer) to count, so a single common word doesn't pull in an unrelated answer.
+        """
+        question_tokens = set(_TOKEN_PAT.findall(question.lower()))
+        matches = Counter(element for token in question_tokens for element in self._token_index.get(token, ()))
+        for element, shared in matches.most_common():
+            if shared >= min(2, len(set(_TOKEN_PAT.findall(element.lower())))):
+                return self._resolution_cache[element]
+        return None
+    
+    def _search(self, query: str):
+        """Run the injected web search function"""
+        # Use the web_search function that's available in the environment
+        # This will be dynamically injected by the parent process
+        if hasattr(self, '_web_search_func'):
+            return self._web_search_func(query)
+        # Fallback for testing
+        return f"Mock search results for: {query}"
+    
+    def _extraction_prompt(self, ambiguity: Dict[str, str], search_results) -> str:
+        """Build the prompt that extracts a clarification from search results"""
+        element = ambiguity.get('element', '')
+        return f"""Extract relevant information from these search results to clarify the ambiguous element.
+
+Ambiguous element: "{element}"
+Type: {ambiguity.get('type', 'UNKNOWN')}
+Search query was: "{ambiguity.get('search_hint', element)}"
+
+Search results:
+{str(search_results)[:2000]}
+
+Provide a concise, factual clarification (1-2 sentences max) that would help someone complete the task:"""
+    
     def rewrite_query(self, original_query: str, clarifications: Dict[str, str]) -> str:
         """Create a precise, enriched query"""
         
@@ -244,16 +472,26 @@ Rewritten query:"""
             print(f"Warning: Failed to rewrite query: {e}")
             return original_query
     
-    def mid_task_clarify(self, question: str) -> str:
-        """Provide additional information during execution"""
+    def mid_task_clarify(self, question: str, stream: bool = False) -> str:
+        """Provide additional information during execution
+        
+        With stream=True the answer is printed token by token as it arrives;
+        the full answer is still returned and cached.
+        """
         
         print(f"\n🤔 Agent needs clarification: {question}")
         
+        key = " ".join(question.lower().split())
+        cached = self._clarify_cache.get(key)
+        if cached and time.time() - cached["ts"] <= CLARIFY_CACHE_TTL_S:
+            print(f"📋 Found cached answer: {cached['answer']}")
+            return cached["answer"]
+        
         # Try to answer from cached information first
-        for cached_element, cached_resolution in self._resolution_cache.items():
-            if any(word in question.lower() for word in cached_element.lower().split()):
-                print(f"📋 Found cached info: {cached_resolution}")
-                return cached_resolution
+        cached_resolution = self._match_resolution(key)
+        if cached_resolution is not None:
+            print(f"📋 Found cached info: {cached_resolution}")
+            return cached_resolution
         
         # Perform new search if needed
         try:
@@ -274,15 +512,54 @@ Search results:
 
 Provide a direct, helpful answer (1-2 sentences) that would help the Windows automation agent:"""
 
-            response = self.llm.invoke(answer_prompt)
-            answer = response.content.strip()
+            if stream:
+                sys.stdout.write("🌐 Web search answer: ")
+                parts = []
+                for chunk in self.llm.stream(answer_prompt):
+                    parts.append(chunk.content)
+                    sys.stdout.write(chunk.content)
+                    sys.stdout.flush()
+                sys.stdout.write("\n")
+                answer = "".join(parts).strip()
+            else:
+                response = self.llm.invoke(answer_prompt)
+                answer = response.content.strip()
+                print(f"🌐 Web search answer: {answer}")
             
-            print(f"🌐 Web search answer: {answer}")
+            self._clarify_cache[key] = {"answer": answer, "ts": time.time()}
             return answer
             
         except Exception as e:
             print(f"Warning: Failed to clarify '{question}': {e}")
             return "Unable to find clarification information."
+    
+    def clarify_many(self, questions: List[str], max_workers: int = 3) -> List[str]:
+        """Answer several independent questions concurrently, returning answers in input order"""
+        if not questions:
+            return []
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(questions))) as executor:
+            return list(executor.map(self.mid_task_clarify, questions))
+    
+    def prefetch_clarifications(self, questions: List[str], max_workers: int = 3) -> Dict[str, Future]:
+        """Start answering likely mid-task questions in the background
+        
+        Answers land in the clarification cache, so a later mid_task_clarify for the
+        same question returns immediately. Questions already cached are skipped.
+        """
+        now = time.time()
+        pending = []
+        for question in questions:
+            cached = self._clarify_cache.get(" ".join(question.lower().split()))
+            if not (cached and now - cached["ts"] <= CLARIFY_CACHE_TTL_S):
+                pending.append(question)
+        if not pending:
+            return {}
+        
+        executor = ThreadPoolExecutor(max_workers=min(max_workers, len(pending)))
+        futures = {q: executor.submit(self.mid_task_clarify, q) for q in pending}
+        # Let the workers finish on their own; callers may wait on the futures
+        executor.shutdown(wait=False)
+        return futures
 
 
 class TaskAnalyzer:
@@ -290,17 +567,12 @@ class TaskAnalyzer:
     
     def __init__(self):
         # Use Qwen for cheap analysis
-        self.llm = ChatOpenAI(
-            model="qwen/qwen-2.5-72b-instruct",
-            temperature=0.1,
-            max_tokens=500,
-            api_key=os.getenv("OPENROUTER_API_KEY"),
-            base_url="https://openrouter.ai/api/v1",
-            default_headers={
-                "HTTP-Referer": os.getenv("OPENROUTER_HTTP_REFERER", "https://github.com/windows-use"),
-                "X-Title": os.getenv("OPENROUTER_X_TITLE", "Windows-Use Enhanced")
-            }
-        )
+        self.model = "qwen/qwen-2.5-72b-instruct"
+        self.temperature = 0.1
+        self.llm = _make_openrouter_llm(self.model, temperature=self.temperature, max_tokens=500, title="Windows-Use Enhanced")
+        # Parsed steps for repeat prompts, expiring after the LLMCache TTL. Only the analyzer is
+        # cached: translator answers come from live web search and go stale
+        self.cache = LLMCache() if self.temperature <= MAX_CACHEABLE_TEMPERATURE else None
     
     def analyze(self, query: str) -> List[str]:
         """Convert user query into specific step-by-step instructions"""
@@ -325,11 +597,36 @@ Return ONLY a JSON array of guidance steps, like:
 
 Steps:"""
 
-        response = self.llm.invoke(prompt)
-        return self._parse_instructions(response.content)
+        key = cache_key(self.model, prompt, self.temperature)
+        if self.cache is not None:
+            cached = self.cache.get(key)
+            if cached is not None:
+                return self._parse_instructions(cached)
+        instructions, parsed = self._generate(prompt)
+        # Only plans that parsed as structured output or JSON are stored; line-split
+        # fragments from a malformed reply are used once and retried next time
+        if parsed and instructions and self.cache is not None:
+            self.cache.set(key, json.dumps(instructions, ensure_ascii=False))
+        return instructions
+    
+    def _generate(self, prompt: str) -> Tuple[List[str], bool]:
+        """Ask the LLM for guidance steps; the flag is False when they came from the line-split fallback"""
+        instructions = _structured_invoke(self.llm, Instructions, prompt)
+        if not isinstance(instructions, str):
+            return instructions.steps[:8], True
+        steps = self._load_instructions(instructions)
+        if steps is not None:
+            return steps, True
+        return self._split_instructions(instructions), False
     
     def _parse_instructions(self, content: str) -> List[str]:
         """Extract instructions from LLM response"""
+        steps = self._load_instructions(content)
+        return steps if steps is not None else self._split_instructions(content)
+    
+    @staticmethod
+    def _load_instructions(content: str) -> Optional[List[str]]:
+        """Decode the JSON step array; None when the reply isn't valid JSON"""
         try:
             # Clean up response
             if '```json' in content:
@@ -338,15 +635,17 @@ Steps:"""
                 content = content.split('```')[1].split('```')[0]
             
             instructions = json.loads(content.strip())
-            # Ensure it's a list and cap at 8 instructions
-            if isinstance(instructions, list):
-                return instructions[:8]
-            return []
         except Exception as e:
             print(f"Warning: Failed to parse JSON: {e}")
-            # Try basic line splitting as fallback
-            lines = content.strip().split('\n')
-            return [line.strip('- •123456789.[] "\'') for line in lines if line.strip()][:8]
+            return None
+        # Ensure it's a list and cap at 8 instructions
+        return instructions[:8] if isinstance(instructions, list) else []
+    
+    @staticmethod
+    def _split_instructions(content: str) -> List[str]:
+        """Basic line splitting, the fallback for replies that aren't valid JSON"""
+        lines = content.strip().split('\n')
+        return [line.strip('- •123456789.[] "\'') for line in lines if line.strip()][:8]
 
 
 class WebEnhancedSmartWindowsAgent:
@@ -357,11 +656,8 @@ class WebEnhancedSmartWindowsAgent:
         self.translator = WebEnhancedTranslator(model_name=translation_model)
         self.analyzer = TaskAnalyzer()
         
-        # Use cheapest model for execution
-        self.executor_llm = ChatGoogleGenerativeAI(
-            model='gemini-2.5-flash-lite',
-            temperature=0.0
-        )
+        # Use cheapest model for execution (shared across agent instances)
+        self.executor_llm = _get_executor_llm()
         
         # Set up web search function
         if web_search_func:
@@ -369,19 +665,42 @@ class WebEnhancedSmartWindowsAgent:
         
         # Set up callback for mid-task clarification
         self.translator.mid_task_callback = self._handle_clarification_request
+        
+        # Executor agent (desktop, tool registry, graph) is built once and reused across tasks
+        self._agent = None
     
     def _handle_clarification_request(self, question: str) -> str:
         """Handle mid-task clarification requests from the agent"""
         return self.translator.mid_task_clarify(question)
     
+    def _get_agent(self, instructions: List[str]):
+        """Return the executor agent, built on first use and reset for each new task"""
+        if self._agent is None:
+            from windows_use.agent.enhanced_service import EnhancedAgent
+            
+            self._agent = EnhancedAgent(
+                llm=self.executor_llm,
+                instructions=instructions,  # Pass our generated instructions
+                browser='chrome',
+                use_vision=False,  # Keep vision off for cost
+                max_steps=30,
+                consecutive_failures=3,  # Try alternatives after 3 failures
+                loop_detection=True  # Enable infinite loop detection
+            )
+        else:
+            # Instructions are read on every reasoning step, so swapping them is enough;
+            # per-task failure and loop state must not leak into the next task
+            from windows_use.agent.enhanced_service import LoopDetector
+            
+            self._agent.instructions = instructions
+            self._agent.current_consecutive_failures = 0
+            self._agent.loop_detector = LoopDetector()
+        return self._agent
+    
     def execute(self, query: str) -> str:
         """Execute task with web-enhanced translation and instruction generation"""
         
-        print("="*80)
-        print(f"WEB-ENHANCED SMART WINDOWS AGENT")
-        print("="*80)
-        print(f"Task: {query}")
-        print("-"*80)
+        sys.stdout.write(f"{BAR80}\nWEB-ENHANCED SMART WINDOWS AGENT\n{BAR80}\nTask: {query}\n{RULE80}\n")
         
         # Step 1: Web-enhanced translation
         enriched_query = self.translator.translate(query)
@@ -394,32 +713,24 @@ class WebEnhancedSmartWindowsAgent:
             print("❌ Failed to understand task")
             return "Failed to understand task"
         
-        print(f"\n📋 Generated {len(instructions)} instructions:")
-        for i, inst in enumerate(instructions, 1):
-            print(f"   {i}. {inst}")
+        listing = "".join(f"   {i}. {inst}\n" for i, inst in enumerate(instructions, 1))
+        sys.stdout.write(f"\n📋 Generated {len(instructions)} instructions:\n{listing}")
         
         # Step 3: Execute with Windows-Use
-        print(f"\n🤖 Executing with Windows-Use agent...")
-        print(f"   Model: gemini-2.5-flash-lite")
-        print(f"   Vision: False")
-        print(f"   Max steps: 30")
-        print(f"   Web-enhanced: True")
-        print("\n" + "-"*80)
+        sys.stdout.write(
+            "\n🤖 Executing with Windows-Use agent...\n"
+            "   Model: gemini-2.5-flash-lite\n"
+            "   Vision: False\n"
+            "   Max steps: 30\n"
+            "   Web-enhanced: True\n"
+            f"\n{RULE80}\n"
+        )
         
         try:
-            agent = EnhancedAgent(
-                llm=self.executor_llm,
-                instructions=instructions,  # Pass our generated instructions
-                browser='chrome',
-                use_vision=False,  # Keep vision off for cost
-                max_steps=30,
-                consecutive_failures=3,  # Try alternatives after 3 failures
-                loop_detection=True  # Enable infinite loop detection
-            )
-            
+            agent = self._get_agent(instructions)
             result = agent.invoke(enriched_query)
             
-            print("-"*80)
+            print(RULE80)
             
             if result.error:
                 print(f"\n❌ Execution error: {result.error}")
@@ -435,12 +746,14 @@ class WebEnhancedSmartWindowsAgent:
 
 def main():
     """Main entry point with example usage"""
-    print("Web-Enhanced Smart Windows Agent (V1.1)")
-    print("Resolves query ambiguities using web search before execution")
-    print("Models: GPT-4o Mini Search Preview :online (translation & web search), Qwen 72B (analysis), Gemini Flash Lite (execution)")
-    print("Best for tasks with ambiguous location, product, or subjective terms")
-    print("Example: 'Find a cheap screwdriver at Lowe's near Bashford Manor and add to cart'")
-    print()
+    sys.stdout.write(
+        "Web-Enhanced Smart Windows Agent (V1.1)\n"
+        "Resolves query ambiguities using web search before execution\n"
+        "Models: GPT-4o Mini Search Preview :online (translation & web search), Qwen 72B (analysis), Gemini Flash Lite (execution)\n"
+        "Best for tasks with ambiguous location, product, or subjective terms\n"
+        "Example: 'Find a cheap screwdriver at Lowe's near Bashford Manor and add to cart'\n"
+        "\n"
+    )
     
     # Note: In a real environment, you would pass the actual web_search function
     # For testing without web search, the agent will use mock responses
@@ -452,10 +765,7 @@ def main():
     # Execute with web enhancement
     result = agent.execute(query)
     
-    print("\n" + "="*80)
-    print("FINAL RESULT:")
-    print("="*80)
-    print(result)
+    sys.stdout.write(f"\n{BAR80}\nFINAL RESULT:\n{BAR80}\n{result}\n")
 
 
 if __name__ == "__main__":
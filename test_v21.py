@@ -90,6 +90,13 @@ def interactive_test():
         if continue_test.lower() not in ['y', 'yes']:
             break
 
+# Menu choice -> automated test, in run-all order
+_TESTS = {
+    "1": test_simple_task,
+    "2": test_medium_complexity,
+    "3": test_complex_task,
+}
+
 def main():
     """Main test runner"""
     print("Enhanced Multi-Stage Agent (V2.1) - Test Suite")
@@ -102,9 +109,8 @@ def main():
     if test_mode == "1":
         print("\nRunning all automated tests...")
         try:
-            test_simple_task()
-            test_medium_complexity() 
-            test_complex_task()
+            for test in _TESTS.values():
+                test()
             print("\n" + "="*60)
             print("ALL TESTS COMPLETED")
             print("="*60)
@@ -117,13 +123,10 @@ def main():
     elif test_mode == "3":
         test_choice = input("\nWhich test?\n1. Simple task\n2. Medium complexity\n3. Complex task\nChoice (1/2/3): ")
         
+        test = _TESTS.get(test_choice)
         try:
-            if test_choice == "1":
-                test_simple_task()
-            elif test_choice == "2":
-                test_medium_complexity()
-            elif test_choice == "3":
-                test_complex_task()
+            if test:
+                test()
             else:
                 print("Invalid choice")
         except Exception as e:
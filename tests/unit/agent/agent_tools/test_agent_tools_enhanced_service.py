@@ -0,0 +1,83 @@
+# tests/unit/agent/agent_tools/test_agent_tools_enhanced_service.py
+
+from windows_use.agent.tools.enhanced_service import InteractionTracker, InteractionStrategy
+
+class TestInteractionTracker:
+    """
+    Tests for the InteractionTracker dataclass in windows_use.agent.tools.enhanced_service.
+    """
+
+    def test_failed_strategies_are_excluded(self):
+        """
+        Test that strategies which failed at a location are not offered again for it.
+
+        What is being tested:
+            - `get_available_strategies` omits every strategy recorded as failed for the location.
+            - Other locations are unaffected.
+        """
+        tracker = InteractionTracker()
+        tracker.record_attempt((10, 20), InteractionStrategy.DIRECT_CLICK, False)
+        tracker.record_attempt((10, 20), InteractionStrategy.KEYBOARD_NAV, False)
+
+        available = tracker.get_available_strategies((10, 20))
+        assert InteractionStrategy.DIRECT_CLICK not in available
+        assert InteractionStrategy.KEYBOARD_NAV not in available
+        assert len(available) == len(InteractionStrategy) - 2
+        assert tracker.get_available_strategies((0, 0)) == list(InteractionStrategy)
+
+    def test_repeated_failures_recorded_once(self):
+        """
+        Test that the same strategy failing repeatedly is stored only once per location.
+
+        What is being tested:
+            - `failed_strategies` holds unique strategies.
+            - `consecutive_failures` still counts every failure.
+        """
+        tracker = InteractionTracker()
+        for _ in range(3):
+            tracker.record_attempt((5, 5), InteractionStrategy.DIRECT_CLICK, False)
+
+        assert tracker.failed_strategies[(5, 5)] == {InteractionStrategy.DIRECT_CLICK}
+        assert tracker.consecutive_failures == 3
+
+    def test_success_resets_consecutive_failures(self):
+        """
+        Test that a successful attempt resets the failure streak.
+
+        What is being tested:
+            - `consecutive_failures` is reset to 0.
+            - `last_successful_strategy` records the strategy that worked.
+        """
+        tracker = InteractionTracker()
+        tracker.record_attempt((5, 5), InteractionStrategy.DIRECT_CLICK, False)
+        tracker.record_attempt((5, 5), InteractionStrategy.ELEMENT_SEARCH, True)
+
+        assert tracker.consecutive_failures == 0
+        assert tracker.last_successful_strategy == InteractionStrategy.ELEMENT_SEARCH
+
+    def test_should_try_alternative_after_two_attempts(self):
+        """
+        Test that a location attempted twice triggers alternative strategies.
+
+        What is being tested:
+            - `should_try_alternative` is False after one attempt and True after two.
+        """
+        tracker = InteractionTracker()
+        tracker.record_attempt((1, 1), InteractionStrategy.DIRECT_CLICK, True)
+        assert tracker.should_try_alternative((1, 1)) is False
+        tracker.record_attempt((1, 1), InteractionStrategy.DIRECT_CLICK, True)
+        assert tracker.should_try_alternative((1, 1)) is True
+
+    def test_action_history_is_bounded(self):
+        """
+        Test that only the last 10 attempts are kept.
+
+        What is being tested:
+            - `action_history` never exceeds 10 entries and keeps the most recent attempt.
+        """
+        tracker = InteractionTracker()
+        for i in range(25):
+            tracker.record_attempt((i, i), InteractionStrategy.DIRECT_CLICK, True)
+
+        assert len(tracker.action_history) == 10
+        assert tracker.action_history[-1]['location'] == (24, 24)
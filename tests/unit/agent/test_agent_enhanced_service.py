@@ -0,0 +1,66 @@
+from windows_use.agent.enhanced_service import LoopDetector
+
+class TestLoopDetector:
+    """
+    Tests for the LoopDetector class in windows_use.agent.enhanced_service.
+    """
+
+    def test_identical_actions_detected_at_threshold(self):
+        """
+        Test that repeating the same action `pattern_threshold` times is reported as a loop.
+
+        What is being tested:
+            - `add_action` returns False until the run of identical actions reaches the threshold.
+            - The call that completes the run returns True.
+        """
+        detector = LoopDetector(pattern_threshold=3)
+        results = [detector.add_action("Click Tool", {"loc": [10, 20]}) for _ in range(3)]
+        assert results == [False, False, True]
+
+    def test_different_params_break_the_run(self):
+        """
+        Test that an action with different parameters resets the identical-action run.
+
+        What is being tested:
+            - Actions differing only in params are not treated as identical.
+        """
+        detector = LoopDetector(pattern_threshold=3)
+        assert detector.add_action("Click Tool", {"loc": [10, 20]}) is False
+        assert detector.add_action("Click Tool", {"loc": [10, 20]}) is False
+        assert detector.add_action("Click Tool", {"loc": [30, 40]}) is False
+        assert detector.add_action("Click Tool", {"loc": [30, 40]}) is False
+
+    def test_param_order_is_ignored(self):
+        """
+        Test that dictionaries with the same items in a different order are treated as identical.
+
+        What is being tested:
+            - Nested params (dicts and lists) are compared by value, independent of key order.
+        """
+        detector = LoopDetector(pattern_threshold=2)
+        assert detector.add_action("Type Tool", {"loc": [1, 2], "text": "hi"}) is False
+        assert detector.add_action("Type Tool", {"text": "hi", "loc": [1, 2]}) is True
+
+    def test_alternating_pattern_detected(self):
+        """
+        Test that an A-B-A-B pattern is reported when the threshold covers four actions.
+
+        What is being tested:
+            - With `pattern_threshold=4`, alternating between two actions is detected as a loop.
+        """
+        detector = LoopDetector(pattern_threshold=4)
+        results = [detector.add_action(name, {"loc": [1, 2]}) for name in ["A", "B", "A", "B"]]
+        assert results == [False, False, False, True]
+
+    def test_history_is_bounded(self):
+        """
+        Test that the action history never grows beyond `max_history`.
+
+        What is being tested:
+            - `action_history` keeps only the most recent `max_history` actions.
+        """
+        detector = LoopDetector(max_history=5)
+        for i in range(20):
+            detector.add_action("Move Tool", {"to_loc": [i, i]})
+        assert len(detector.action_history) == 5
+        assert detector.action_history[-1].params == {"to_loc": [19, 19]}
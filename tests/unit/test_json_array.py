@@ -0,0 +1,109 @@
+import pytest
+
+from json_array import ArrayScanner, extract_json_array
+
+class TestExtractJsonArray:
+    """
+    Tests for the extract_json_array function in json_array.
+    """
+
+    def test_plain_array(self):
+        """
+        Test that a bare array is returned unchanged.
+        """
+        assert extract_json_array('["Open Notepad", "Type hello"]') == '["Open Notepad", "Type hello"]'
+
+    @pytest.mark.parametrize("content", [
+        '```json\n["Open Notepad"]\n```',
+        '```\n["Open Notepad"]\n```',
+        'Here are the steps:\n["Open Notepad"]\nLet me know if you need more.',
+    ])
+    def test_fences_and_prose_are_skipped(self, content):
+        """
+        Test that code fences and surrounding prose are dropped.
+        """
+        assert extract_json_array(content) == '["Open Notepad"]'
+
+    def test_brackets_inside_strings_are_ignored(self):
+        """
+        Test that '[' and ']' inside string literals don't change the nesting depth.
+        """
+        content = '["Click [OK]", "Type ]["] trailing ]'
+        assert extract_json_array(content) == '["Click [OK]", "Type ]["]'
+
+    def test_escaped_quotes_stay_inside_the_string(self):
+        """
+        Test that an escaped quote doesn't end the string literal.
+
+        What is being tested:
+            - The ']' after the escaped quote is still treated as string content.
+        """
+        content = r'["Type \"]\" here", "Save"] done'
+        assert extract_json_array(content) == r'["Type \"]\" here", "Save"]'
+
+    def test_nested_arrays(self):
+        """
+        Test that the outer array is returned whole for nested (batch) responses.
+        """
+        assert extract_json_array('[["a", "b"], ["c"]] extra') == '[["a", "b"], ["c"]]'
+
+    def test_unclosed_array_returns_remainder(self):
+        """
+        Test that a truncated array returns the rest of the text for the decoder to reject.
+        """
+        assert extract_json_array('Steps: ["Open Notepad", "Ty') == '["Open Notepad", "Ty'
+
+    def test_no_array_returns_stripped_text(self):
+        """
+        Test that text without '[' is returned stripped.
+        """
+        assert extract_json_array('  no steps  ') == 'no steps'
+
+class TestArrayScanner:
+    """
+    Tests for the ArrayScanner class in json_array.
+    """
+
+    def test_returns_none_while_open(self):
+        """
+        Test that feed() returns None until the top-level array closes.
+        """
+        scanner = ArrayScanner()
+        assert scanner.feed('["Open') is None
+        assert scanner.feed(' Notepad"') is None
+
+    def test_returns_index_past_closing_bracket(self):
+        """
+        Test that feed() returns the index just past the closing ']' within the piece.
+        """
+        scanner = ArrayScanner()
+        assert scanner.feed('["a"]\nMore text') == 5
+
+    def test_prose_before_array_is_skipped(self):
+        """
+        Test that quotes and ']' before the first '[' are ignored.
+        """
+        scanner = ArrayScanner()
+        assert scanner.feed('He said "go" ] then ') is None
+        assert scanner.feed('["a"]') == 5
+
+    def test_chunk_boundary_inside_string(self):
+        """
+        Test that string state carries across pieces.
+
+        What is being tested:
+            - A ']' in the piece after the string was opened is string content.
+            - The array closes in a later piece.
+        """
+        scanner = ArrayScanner()
+        assert scanner.feed('["Click ') is None
+        assert scanner.feed('[OK]"') is None
+        assert scanner.feed(', "Save"]') == 9
+
+    def test_chunk_boundary_after_escape(self):
+        """
+        Test that an escape at the end of one piece applies to the first character of the next.
+        """
+        scanner = ArrayScanner()
+        assert scanner.feed('["say \\') is None
+        assert scanner.feed('"]"]') == 4
@@ -0,0 +1,121 @@
+import pytest
+
+import llm_cache
+from llm_cache import LLMCache, cache_key
+
+class TestCacheKey:
+    """
+    Tests for the cache_key function in llm_cache.
+    """
+
+    def test_key_is_stable(self):
+        """
+        Test that the same model, prompt and temperature always give the same key.
+        """
+        assert cache_key("qwen/qwen-2.5-72b-instruct", "Open Notepad", 0.1) == cache_key("qwen/qwen-2.5-72b-instruct", "Open Notepad", 0.1)
+
+    def test_key_is_sha256_hex(self):
+        """
+        Test that the key is a 64-character hex digest.
+        """
+        key = cache_key("model", "prompt", 0.0)
+        assert len(key) == 64
+        int(key, 16)
+
+    @pytest.mark.parametrize("model, prompt, temperature", [
+        ("other-model", "Open Notepad", 0.1),
+        ("qwen/qwen-2.5-72b-instruct", "Open Calculator", 0.1),
+        ("qwen/qwen-2.5-72b-instruct", "Open Notepad", 0.0),
+    ])
+    def test_key_changes_with_each_input(self, model, prompt, temperature):
+        """
+        Test that changing any one of model, prompt or temperature changes the key.
+        """
+        assert cache_key(model, prompt, temperature) != cache_key("qwen/qwen-2.5-72b-instruct", "Open Notepad", 0.1)
+
+class TestLLMCache:
+    """
+    Tests for the LLMCache class in llm_cache.
+    """
+
+    @pytest.fixture
+    def clock(self, monkeypatch):
+        """
+        A controllable time.time() for the llm_cache module.
+        """
+        now = [1_000_000.0]
+        monkeypatch.setattr(llm_cache.time, "time", lambda: now[0])
+        return now
+
+    def test_get_missing_returns_none(self, tmp_path):
+        """
+        Test that an unknown key reads as a miss.
+        """
+        cache = LLMCache(path=tmp_path / "llm.sqlite3")
+        assert cache.get("missing") is None
+
+    def test_set_then_get(self, tmp_path):
+        """
+        Test that a stored response is returned for its key.
+        """
+        cache = LLMCache(path=tmp_path / "llm.sqlite3")
+        cache.set("k", '["Open Notepad"]')
+        assert cache.get("k") == '["Open Notepad"]'
+
+    def test_set_overwrites(self, tmp_path):
+        """
+        Test that storing the same key again replaces the response.
+        """
+        cache = LLMCache(path=tmp_path / "llm.sqlite3")
+        cache.set("k", "old")
+        cache.set("k", "new")
+        assert cache.get("k") == "new"
+
+    def test_creates_parent_directory(self, tmp_path):
+        """
+        Test that the cache file's directory is created on open.
+        """
+        path = tmp_path / "nested" / "dir" / "llm.sqlite3"
+        LLMCache(path=path)
+        assert path.parent.is_dir()
+
+    def test_entry_expires_after_ttl(self, tmp_path, clock):
+        """
+        Test TTL expiry on read.
+
+        What is being tested:
+            - An entry is returned up to `ttl_s` seconds after it was stored.
+            - It reads as a miss once `ttl_s` has passed.
+        """
+        cache = LLMCache(path=tmp_path / "llm.sqlite3", ttl_s=60)
+        cache.set("k", "v")
+        clock[0] += 60
+        assert cache.get("k") == "v"
+        clock[0] += 1
+        assert cache.get("k") is None
+
+    def test_persists_across_instances(self, tmp_path):
+        """
+        Test that a response stored by one instance is read by another on the same file.
+        """
+        path = tmp_path / "llm.sqlite3"
+        LLMCache(path=path).set("k", "v")
+        assert LLMCache(path=path).get("k") == "v"
+
+    def test_expired_rows_purged_on_open(self, tmp_path, clock):
+        """
+        Test that opening the cache deletes rows older than the TTL.
+
+        What is being tested:
+            - The expired row is gone from the table, not just hidden from get().
+            - Rows still inside the TTL are kept.
+        """
+        path = tmp_path / "llm.sqlite3"
+        first = LLMCache(path=path, ttl_s=60)
+        first.set("old", "v")
+        clock[0] += 30
+        first.set("fresh", "v")
+        clock[0] += 31
+        reopened = LLMCache(path=path, ttl_s=60)
+        keys = {row[0] for row in reopened._conn.execute("SELECT key FROM responses")}
+        assert keys == {"fresh"}
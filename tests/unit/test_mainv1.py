@@ -0,0 +1,101 @@
+from collections import OrderedDict
+from unittest.mock import MagicMock
+
+from mainv1 import TaskAnalyzer
+
+class TestTaskAnalyzerStream:
+    """
+    Tests for TaskAnalyzer._stream_json_array in mainv1.
+    """
+
+    def _analyzer(self, chunks):
+        analyzer = TaskAnalyzer.__new__(TaskAnalyzer)
+        stream = MagicMock()
+        stream.__iter__.return_value = iter([MagicMock(content=c) for c in chunks])
+        analyzer.llm = MagicMock()
+        analyzer.llm.stream.return_value = stream
+        return analyzer, stream
+
+    def test_stops_at_array_end(self):
+        """
+        Test that reading stops once the array closes and trailing text is cut.
+
+        What is being tested:
+            - The returned text ends at the closing ']'.
+            - The stream is closed.
+        """
+        analyzer, stream = self._analyzer(['["Open', ' Notepad"] and', ' more'])
+        assert analyzer._stream_json_array("prompt") == '["Open Notepad"]'
+        stream.close.assert_called_once()
+
+    def test_returns_everything_when_array_never_closes(self):
+        """
+        Test that a truncated stream returns all received text.
+        """
+        analyzer, _ = self._analyzer(['["Open', ' Note'])
+        assert analyzer._stream_json_array("prompt") == '["Open Note'
+
+class TestTaskAnalyzerBatch:
+    """
+    Tests for TaskAnalyzer.analyze_batch in mainv1.
+    """
+
+    def _analyzer(self, responses):
+        analyzer = TaskAnalyzer.__new__(TaskAnalyzer)
+        analyzer.model = "test-model"
+        analyzer.temperature = 0.1
+        analyzer.max_tokens = 500
+        analyzer.cache = None
+        analyzer._memo = OrderedDict()
+        analyzer._stream_json_array = MagicMock(side_effect=responses)
+        return analyzer
+
+    def test_batch_results_fill_the_memo(self):
+        """
+        Test that one batch call answers every query and memoizes each result.
+        """
+        analyzer = self._analyzer(['[["Open Notepad"], ["Open Chrome", "Go to lowes.com"]]'])
+        assert analyzer.analyze_batch(["open notepad", "buy a screwdriver"]) == [["Open Notepad"], ["Open Chrome", "Go to lowes.com"]]
+        assert analyzer.analyze("open  notepad") == ["Open Notepad"]
+        assert analyzer._stream_json_array.call_count == 1
+
+    def test_memoized_queries_are_not_sent(self):
+        """
+        Test that memoized queries are left out of the batch prompt.
+
+        What is being tested:
+            - With one query left, a single-request prompt is used.
+            - Results are still returned in input order.
+        """
+        analyzer = self._analyzer(['["Open Chrome"]'])
+        analyzer._memo["open notepad"] = ["Open Notepad"]
+        assert analyzer.analyze_batch(["open notepad", "open chrome"]) == [["Open Notepad"], ["Open Chrome"]]
+        prompt = analyzer._stream_json_array.call_args[0][0]
+        assert "open chrome" in prompt and "open notepad" not in prompt
+
+    def test_non_string_steps_reject_the_batch(self):
+        """
+        Test that a batch whose step list holds no strings falls back to one call per query.
+        """
+        def respond(prompt, **kwargs):
+            if "User requests:" in prompt:
+                return '[["Open Notepad"], [{"step": 1}]]'
+            return '["Open Notepad"]' if "open notepad" in prompt else '["Open Chrome"]'
+
+        analyzer = self._analyzer(respond)
+        assert analyzer.analyze_batch(["open notepad", "open chrome"]) == [["Open Notepad"], ["Open Chrome"]]
+        assert analyzer._stream_json_array.call_count == 3
+
+    def test_wrong_length_falls_back(self):
+        """
+        Test that a batch response with the wrong number of step lists is not trusted.
+        """
+        analyzer = self._analyzer(['[["Open Notepad"]]', '["A"]', '["A"]'])
+        assert analyzer.analyze_batch(["first task", "second task"]) == [["A"], ["A"]]
+
+    def test_mixed_steps_keep_only_strings(self):
+        """
+        Test that non-string entries inside a step list are dropped.
+        """
+        analyzer = self._analyzer(['[["Open Notepad", ["nested"], 3], ["Open Chrome"]]'])
+        assert analyzer.analyze_batch(["a", "b"]) == [["Open Notepad"], ["Open Chrome"]]
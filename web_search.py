@@ -4,6 +4,7 @@
 # - Parses OpenRouter "annotations.url_citation" when available
 # - Falls back to URL extraction from content
 # - Simple disk cache + retry with backoff
+# - Keep-alive HTTP session reused across searches
 #
 # Env:
 #   OPENROUTER_API_KEY     (required)
@@ -17,12 +18,22 @@ import re
 import json
 import time
 import hashlib
+from functools import lru_cache
 from pathlib import Path
-from typing import Dict, List, Optional, Callable
+from typing import Dict, List, Optional, Callable, Tuple
 
 import requests
 
 DEFAULT_MODEL = "openai/gpt-4o-mini-search-preview:online"
+MEMO_MAX_ENTRIES = 256
+OPENROUTER_CHAT_URL = "https://openrouter.ai/api/v1/chat/completions"
+_SEARCH_SYSTEM_PROMPT = (
+    "You can browse the web. For the user topic, look up the best 3 supporting sources. "
+    "Return a single concise line of prose (<=200 chars) followed by your sources. "
+    "If possible, include structured citations so the API attaches URL annotations."
+)
+_SEARCH_USER_TEMPLATE = "Find high-quality sources to clarify this user task: {}"
+_URL_RE = re.compile(r"https?://[^\s)>\]]+", re.I)
 
 def _cache_path(cache_dir: Path, key: str) -> Path:
     return cache_dir / f"{key}.json"
@@ -49,6 +60,10 @@ def _hash_key(*parts: str) -> str:
         h.update(b"|")
     return h.hexdigest()
 
+def _normalize_query(q: str) -> str:
+    # Case, spacing and trailing punctuation don't change what the search returns
+    return " ".join(q.lower().split()).rstrip("?.! ")
+
 def _normalize_results(raw: List[dict], limit: int) -> Dict[str, object]:
     # Shape: {"results": [{"title":..., "url":..., "snippet":..., "source":"openrouter:online"}], "count": N}
     items = []
@@ -62,9 +77,9 @@ def _normalize_results(raw: List[dict], limit: int) -> Dict[str, object]:
     return {"results": items, "count": len(items)}
 
 def _extract_urls_from_text(text: str) -> List[str]:
-    url_re = re.compile(r"https?://[^\s)>\]]+", re.I)
-    return url_re.findall(text or "")
+    return _URL_RE.findall(text or "")
 
+@lru_cache(maxsize=8)
 def create_web_search_function(
     api: str = "openrouter_online",
     api_key: Optional[str] = None,
@@ -76,6 +91,8 @@ def create_web_search_function(
     """
     Returns a callable `search(query: str) -> {results: [...], count: int}`
     Only the OpenRouter :online path is implemented per spec.
+    Calls with the same arguments return the same callable, so every caller
+    in a process shares one search function and its state.
     """
     if api != "openrouter_online":
         raise ValueError("Only 'openrouter_online' is supported in this build.")
@@ -95,30 +112,37 @@ def create_web_search_function(
     if os.getenv("OPENROUTER_APP_NAME"):
         headers["X-Title"] = os.getenv("OPENROUTER_APP_NAME")
 
+    # One pooled session per search function so repeat calls reuse the TLS connection
+    session = requests.Session()
+    session.headers.update(headers)
+
+    # In-memory layer in front of the disk cache: key -> (stored_at, serialized result).
+    # Results are stored as JSON text and decoded per hit, so every caller of this shared
+    # function gets its own copy and mutating it can't corrupt the cache
+    memo: Dict[str, Tuple[float, str]] = {}
+
+    def _memo_set(ck: str, data: Dict[str, object]) -> None:
+        if len(memo) >= MEMO_MAX_ENTRIES:
+            memo.pop(next(iter(memo)))  # drop the oldest insertion
+        memo[ck] = (time.time(), json.dumps(data, ensure_ascii=False))
+
     def _search_openrouter_online(q: str) -> Dict[str, object]:
-        ck = _hash_key("openrouter_online", openrouter_model, str(max_results), q)
+        ck = _hash_key("openrouter_online", openrouter_model, str(max_results), _normalize_query(q))
         if cache_results:
+            hit = memo.get(ck)
+            if hit is not None and (cache_ttl_s <= 0 or time.time() - hit[0] <= cache_ttl_s):
+                return json.loads(hit[1])
             cached = _cache_get(cache_dir, ck, cache_ttl_s)
             if cached is not None:
+                _memo_set(ck, cached)
                 return cached
 
-        url = "https://openrouter.ai/api/v1/chat/completions"
         body = {
             "model": openrouter_model,  # e.g., "openai/gpt-4o-mini-search-preview:online"
             # NO plugins — defer plugin form per spec
             "messages": [
-                {
-                    "role": "system",
-                    "content": (
-                        "You can browse the web. For the user topic, look up the best 3 supporting sources. "
-                        "Return a single concise line of prose (<=200 chars) followed by your sources. "
-                        "If possible, include structured citations so the API attaches URL annotations."
-                    ),
-                },
-                {
-                    "role": "user",
-                    "content": f"Find high-quality sources to clarify this user task: {q}",
-                },
+                {"role": "system", "content": _SEARCH_SYSTEM_PROMPT},
+                {"role": "user", "content": _SEARCH_USER_TEMPLATE.format(q)},
             ],
             "temperature": 0.0,
         }
@@ -127,7 +151,7 @@ def create_web_search_function(
         last_err = None
         for attempt in range(3):
             try:
-                resp = requests.post(url, headers=headers, json=body, timeout=45)
+                resp = session.post(OPENROUTER_CHAT_URL, json=body, timeout=45)
                 # Handle HTTP-level rate limiting
                 if resp.status_code == 429:
                     time.sleep(0.8 * (attempt + 1))
@@ -159,6 +183,7 @@ def create_web_search_function(
                 out = _normalize_results(results, max_results)
                 if cache_results:
                     _cache_set(cache_dir, ck, out)
+                    _memo_set(ck, out)
                 return out
             except Exception as e:
                 last_err = e
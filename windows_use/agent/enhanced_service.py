@@ -28,6 +28,14 @@ formatter = logging.Formatter('%(message)s')
 handler.setFormatter(formatter)
 logger.addHandler(handler)
 
+def _freeze(value):
+    """Convert action params into a hashable, order-independent key"""
+    if isinstance(value, dict):
+        return tuple(sorted((k, _freeze(v)) for k, v in value.items()))
+    if isinstance(value, (list, tuple)):
+        return tuple(_freeze(v) for v in value)
+    return value
+
 @dataclass
 class ActionPattern:
     """Track patterns in agent actions to detect infinite loops"""
@@ -41,42 +49,35 @@ class LoopDetector:
     def __init__(self, max_history: int = 10, pattern_threshold: int = 3):
         self.action_history = deque(maxlen=max_history)
         self.pattern_threshold = pattern_threshold
+        # Hashable keys of recent actions and the length of the current identical run
+        self._keys = deque(maxlen=max_history)
+        self._run_length = 0
         
     def add_action(self, action_name: str, params: Dict) -> bool:
         """Add action to history and return True if loop detected"""
-        pattern = ActionPattern(action_name, params, time.time())
-        self.action_history.append(pattern)
+        key = (action_name, _freeze(params))
+        if self._keys and self._keys[-1] == key:
+            self._run_length += 1
+        else:
+            self._run_length = 1
+        self._keys.append(key)
+        self.action_history.append(ActionPattern(action_name, params, time.time()))
         
         # Check for repetitive patterns
-        if len(self.action_history) >= self.pattern_threshold:
+        if len(self._keys) >= self.pattern_threshold:
             # Check if last N actions are identical
-            recent_actions = list(self.action_history)[-self.pattern_threshold:]
-            
-            # Compare actions (ignoring timestamps)
-            if all(self._actions_identical(recent_actions[0], action) for action in recent_actions):
-                return True
-                
-            # Check for alternating patterns (A-B-A-B)
-            if len(recent_actions) >= 4 and self._detect_alternating_pattern(recent_actions):
+            if self._run_length >= self.pattern_threshold:
                 return True
+            
+            # Check for alternating patterns (A-B-A-B) at the start of the last N actions
+            if self.pattern_threshold >= 4:
+                start = len(self._keys) - self.pattern_threshold
+                a, b, c, d = (self._keys[start + i] for i in range(4))
+                if a == c and b == d and a != b:
+                    return True
                 
         return False
     
-    def _actions_identical(self, action1: ActionPattern, action2: ActionPattern) -> bool:
-        """Check if two actions are identical (excluding timestamp)"""
-        return (action1.action_name == action2.action_name and 
-                action1.params == action2.params)
-    
-    def _detect_alternating_pattern(self, actions: List[ActionPattern]) -> bool:
-        """Detect A-B-A-B alternating patterns"""
-        if len(actions) < 4:
-            return False
-            
-        # Check if we have A-B-A-B pattern
-        return (self._actions_identical(actions[0], actions[2]) and
-                self._actions_identical(actions[1], actions[3]) and
-                not self._actions_identical(actions[0], actions[1]))
-    
     def get_suggested_alternatives(self) -> List[str]:
         """Get suggested alternative actions when loop detected"""
         return [
@@ -3,7 +3,7 @@ from windows_use.desktop.service import Desktop
 from humancursor import SystemCursor
 from markdownify import markdownify
 from langchain.tools import tool
-from typing import Literal, Dict, List, Optional, Tuple
+from typing import Literal, Deque, Dict, List, Optional, Set, Tuple
 import uiautomation as uia
 import pyperclip as pc
 import pyautogui as pg
@@ -11,6 +11,7 @@ import requests
 import time
 import logging
 from dataclasses import dataclass, field
+from collections import deque
 from enum import Enum
 
 logger = logging.getLogger(__name__)
@@ -38,8 +39,9 @@ class ActionResult:
 class InteractionTracker:
     """Tracks interaction attempts and failures for adaptive behavior"""
     location_attempts: Dict[Tuple[int, int], int] = field(default_factory=dict)
-    action_history: List[Dict] = field(default_factory=list)
-    failed_strategies: Dict[Tuple[int, int], List[InteractionStrategy]] = field(default_factory=dict)
+    # Keep only last 10 actions to prevent memory bloat
+    action_history: Deque[Dict] = field(default_factory=lambda: deque(maxlen=10))
+    failed_strategies: Dict[Tuple[int, int], Set[InteractionStrategy]] = field(default_factory=dict)
     consecutive_failures: int = 0
     last_successful_strategy: Optional[InteractionStrategy] = None
     
@@ -48,9 +50,7 @@ class InteractionTracker:
         self.location_attempts[location] = self.location_attempts.get(location, 0) + 1
         
         if not success:
-            if location not in self.failed_strategies:
-                self.failed_strategies[location] = []
-            self.failed_strategies[location].append(strategy)
+            self.failed_strategies.setdefault(location, set()).add(strategy)
             self.consecutive_failures += 1
         else:
             self.consecutive_failures = 0
@@ -62,10 +62,6 @@ class InteractionTracker:
             'success': success,
             'timestamp': time.time()
         })
-        
-        # Keep only last 10 actions to prevent memory bloat
-        if len(self.action_history) > 10:
-            self.action_history = self.action_history[-10:]
     
     def should_try_alternative(self, location: Tuple[int, int]) -> bool:
         """Determine if we should try alternative strategies"""
@@ -73,9 +69,8 @@ class InteractionTracker:
     
     def get_available_strategies(self, location: Tuple[int, int]) -> List[InteractionStrategy]:
         """Get strategies that haven't failed for this location"""
-        failed = self.failed_strategies.get(location, [])
-        all_strategies = list(InteractionStrategy)
-        return [s for s in all_strategies if s not in failed]
+        failed = self.failed_strategies.get(location, ())
+        return [s for s in InteractionStrategy if s not in failed]
 
 # Global interaction tracker
 interaction_tracker = InteractionTracker()
@@ -267,7 +262,7 @@ def enhanced_click_tool(loc: tuple[int, int], button: Literal['left', 'right', '
         if not available_strategies:
             # If all strategies failed, reset and try direct click one more time
             logger.warning(f"⚠️ All strategies exhausted for {loc}, resetting and trying direct click")
-            interaction_tracker.failed_strategies[loc] = []
+            interaction_tracker.failed_strategies[loc] = set()
             available_strategies = [InteractionStrategy.DIRECT_CLICK]
         
         # Try strategies in order of preference